@@ -0,0 +1,132 @@
+// (C) Coralbits SL 2025
+// This file is part of Coralpages and is licensed under the
+// GNU Affero General Public License v3.0.
+// A commercial license on request is also available;
+// contact info@coralbits.com for details.
+
+use std::borrow::Borrow;
+use std::collections::{BTreeMap, HashMap};
+use std::hash::Hash;
+
+/// Bounded in-process map that evicts the least recently used entries when full.
+///
+/// It is bounded by number of entries, and optionally by their total weight,
+/// as given by the caller on insert, see `with_max_weight`. Entries are also
+/// indexed by when they were last used, so finding the ones to evict does not
+/// scan the whole map.
+///
+/// It is not synchronized; wrap it in a `Mutex` to share it between tasks.
+pub struct LruCache<K, V> {
+    capacity: usize,
+    max_weight: usize,
+    weight: usize,
+    tick: u64,
+    // last use tick, weight and value
+    entries: HashMap<K, (u64, usize, V)>,
+    // keys by the tick they were last used at, oldest first
+    order: BTreeMap<u64, K>,
+}
+
+impl<K: Hash + Eq + Clone, V> LruCache<K, V> {
+    pub fn new(capacity: usize) -> Self {
+        Self {
+            capacity,
+            max_weight: usize::MAX,
+            weight: 0,
+            tick: 0,
+            entries: HashMap::with_capacity(capacity),
+            order: BTreeMap::new(),
+        }
+    }
+
+    /// Also bounds the total weight of the entries, as given to `insert_weighted`,
+    /// usually their size in bytes.
+    pub fn with_max_weight(mut self, max_weight: usize) -> Self {
+        self.max_weight = max_weight;
+        self
+    }
+
+    pub fn get<Q>(&mut self, key: &Q) -> Option<&V>
+    where
+        K: Borrow<Q>,
+        Q: Hash + Eq + ?Sized,
+    {
+        let entry = self.entries.get_mut(key)?;
+        self.tick += 1;
+        // move the key to the newest end of the order, it is the same key, not a copy
+        if let Some(key) = self.order.remove(&entry.0) {
+            self.order.insert(self.tick, key);
+        }
+        entry.0 = self.tick;
+        Some(&entry.2)
+    }
+
+    /// Like `get`, but without counting it as a use, so it does not keep the entry
+    /// from being evicted. For checking an entry before deciding to use it.
+    pub fn peek<Q>(&self, key: &Q) -> Option<&V>
+    where
+        K: Borrow<Q>,
+        Q: Hash + Eq + ?Sized,
+    {
+        self.entries.get(key).map(|(_, _, value)| value)
+    }
+
+    pub fn insert(&mut self, key: K, value: V) {
+        self.insert_weighted(key, value, 0);
+    }
+
+    /// Inserts the value, evicting the least recently used entries until both
+    /// it and its weight fit. Values heavier than the whole cache are not kept.
+    pub fn insert_weighted(&mut self, key: K, value: V, weight: usize) {
+        // the old value goes in any case, it is not the current one any more
+        self.remove(&key);
+        if self.capacity == 0 || weight > self.max_weight {
+            return;
+        }
+        while self.entries.len() >= self.capacity || self.max_weight - self.weight < weight {
+            self.evict_oldest();
+        }
+        self.tick += 1;
+        self.weight += weight;
+        self.order.insert(self.tick, key.clone());
+        self.entries.insert(key, (self.tick, weight, value));
+    }
+
+    pub fn remove<Q>(&mut self, key: &Q) -> Option<V>
+    where
+        K: Borrow<Q>,
+        Q: Hash + Eq + ?Sized,
+    {
+        let (tick, weight, value) = self.entries.remove(key)?;
+        self.order.remove(&tick);
+        self.weight -= weight;
+        Some(value)
+    }
+
+    pub fn clear(&mut self) {
+        self.entries.clear();
+        self.order.clear();
+        self.weight = 0;
+    }
+
+    pub fn len(&self) -> usize {
+        self.entries.len()
+    }
+
+    pub fn is_empty(&self) -> bool {
+        self.entries.is_empty()
+    }
+
+    /// Total weight of the entries
+    pub fn weight(&self) -> usize {
+        self.weight
+    }
+
+    fn evict_oldest(&mut self) {
+        if let Some((_, key)) = self.order.pop_first() {
+            if let Some((_, weight, _)) = self.entries.remove(&key) {
+                self.weight -= weight;
+            }
+        }
+    }
+}
@@ -6,6 +6,7 @@
 
 pub mod cache;
 mod inmem;
+pub mod lru;
 mod redis;
 mod tests;
 mod types;
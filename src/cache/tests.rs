@@ -7,6 +7,7 @@
 #[cfg(test)]
 mod tests {
     use super::super::cache::cache;
+    use super::super::lru::LruCache;
 
     #[tokio::test]
     async fn test_cache_basic_operations() {
@@ -22,4 +23,78 @@ mod tests {
         let ret = cache.delete("test_key").await;
         assert_eq!(ret, None);
     }
+
+    #[test]
+    fn test_lru_evicts_least_recently_used() {
+        let mut lru = LruCache::new(2);
+        lru.insert("a".to_string(), 1);
+        lru.insert("b".to_string(), 2);
+        // touch a, so b is the oldest one
+        assert_eq!(lru.get("a"), Some(&1));
+        lru.insert("c".to_string(), 3);
+
+        assert_eq!(lru.len(), 2);
+        assert_eq!(lru.get("b"), None);
+        assert_eq!(lru.get("a"), Some(&1));
+        assert_eq!(lru.get("c"), Some(&3));
+
+        assert_eq!(lru.remove("a"), Some(1));
+        assert_eq!(lru.remove("a"), None);
+        assert_eq!(lru.len(), 1);
+    }
+
+    #[test]
+    fn test_lru_insert_existing_refreshes() {
+        let mut lru = LruCache::new(2);
+        lru.insert("a".to_string(), 1);
+        lru.insert("b".to_string(), 2);
+        // replacing a makes it the newest, and evicts nothing
+        lru.insert("a".to_string(), 10);
+        assert_eq!(lru.len(), 2);
+        lru.insert("c".to_string(), 3);
+
+        assert_eq!(lru.get("b"), None);
+        assert_eq!(lru.get("a"), Some(&10));
+        assert_eq!(lru.get("c"), Some(&3));
+
+        lru.clear();
+        assert!(lru.is_empty());
+        lru.insert("d".to_string(), 4);
+        assert_eq!(lru.get("d"), Some(&4));
+    }
+
+    #[test]
+    fn test_lru_evicts_by_weight() {
+        let mut lru = LruCache::new(10).with_max_weight(10);
+        lru.insert_weighted("a".to_string(), 1, 4);
+        lru.insert_weighted("b".to_string(), 2, 4);
+        assert_eq!(lru.weight(), 8);
+        // c only fits once a, the oldest, is gone
+        lru.insert_weighted("c".to_string(), 3, 4);
+        assert_eq!(lru.get("a"), None);
+        assert_eq!(lru.weight(), 8);
+
+        // heavier than the whole cache, it is not kept, and neither is the old value
+        lru.insert_weighted("b".to_string(), 20, 11);
+        assert_eq!(lru.get("b"), None);
+        assert_eq!(lru.get("c"), Some(&3));
+        assert_eq!(lru.weight(), 4);
+
+        assert_eq!(lru.remove("c"), Some(3));
+        assert_eq!(lru.weight(), 0);
+    }
+
+    #[test]
+    fn test_lru_peek_is_not_a_use() {
+        let mut lru = LruCache::new(2);
+        lru.insert("a".to_string(), 1);
+        lru.insert("b".to_string(), 2);
+        // peeked, but a is still the oldest one
+        assert_eq!(lru.peek("a"), Some(&1));
+        lru.insert("c".to_string(), 3);
+
+        assert_eq!(lru.peek("a"), None);
+        assert_eq!(lru.peek("b"), Some(&2));
+        assert_eq!(lru.peek("c"), Some(&3));
+    }
 }
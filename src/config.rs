@@ -5,7 +5,6 @@
 // contact info@coralbits.com for details.
 
 use std::sync::Arc;
-use std::{fs::File, io::BufReader};
 use tokio::sync::{RwLock, RwLockReadGuard};
 
 use notify::{RecursiveMode, Watcher};
@@ -38,6 +37,9 @@ pub struct PdfConfig {
 pub struct ServerConfig {
     pub port: u16,
     pub host: String,
+    /// Mixed into page ETags. Formatted as a date, so it can expire them periodically.
+    #[serde(default)]
+    pub etag_salt: String,
 }
 
 #[derive(Debug, Serialize, Deserialize, Clone)]
@@ -55,10 +57,10 @@ pub struct StoreConfig {
 
 impl Config {
     pub fn read(path: &str) -> anyhow::Result<Self> {
-        let file = File::open(path)
+        // read it whole, serde_yaml parses from a single buffer anyway
+        let data = std::fs::read(path)
             .map_err(|e| anyhow::anyhow!("Failed to open config file {}: {}", path, e))?;
-        let reader = BufReader::new(file);
-        let config: Config = serde_yaml::from_reader(reader)
+        let config: Config = serde_yaml::from_slice(&data)
             .map_err(|e| anyhow::anyhow!("Failed to parse config file {}: {}", path, e))?;
         let config = config.postprocess();
         Ok(config)
@@ -82,6 +84,7 @@ impl Config {
             server: ServerConfig {
                 port: 8006,
                 host: "0.0.0.0".to_string(),
+                etag_salt: String::new(),
             },
             stores: Vec::new(),
         }
@@ -258,6 +261,7 @@ mod tests {
         assert_eq!(config.debug, false);
         assert_eq!(config.server.port, 8006);
         assert_eq!(config.server.host, "0.0.0.0");
+        assert_eq!(config.server.etag_salt, "%Y-%m-%d");
         assert_ne!(config.stores.len(), 0);
     }
 
@@ -100,6 +100,82 @@ mod tests {
         assert_eq!(page.children[0].widget, "div");
     }
 
+    #[test]
+    fn test_fix_deep_page() {
+        let mut element = Element::new("div".to_string(), HashMap::new(), "".to_string());
+        for _ in 0..1_000 {
+            element = Element::new("div".to_string(), HashMap::new(), "".to_string())
+                .with_children(vec![element]);
+        }
+        let page = Page::new().with_children(vec![element]).fix();
+
+        let mut depth = 0;
+        let mut element = &page.children[0];
+        loop {
+            assert!(!element.id.is_empty());
+            assert!(!element.id.starts_with(|c: char| c.is_ascii_digit()));
+            match element.children.first() {
+                Some(child) => element = child,
+                None => break,
+            }
+            depth += 1;
+        }
+        assert_eq!(depth, 1_000);
+    }
+
+    #[test]
+    fn test_page_definition_hash() {
+        let new_page = || {
+            Page::new()
+                .with_title("Test Page".to_string())
+                .with_children(vec![Element::new(
+                    "div".to_string(),
+                    (0..16)
+                        .map(|i| (format!("key{}", i), i.to_string()))
+                        .collect(),
+                    "id".to_string(),
+                )])
+        };
+        let page = new_page();
+        let hash = page.definition_hash();
+        // maps iterate in a different order on each instance
+        assert_eq!(new_page().definition_hash(), hash);
+
+        // kept in the page, and not part of its definition
+        let hashed = page.clone().with_definition_hash();
+        assert_eq!(hashed.definition_hash, Some(hash));
+        assert_eq!(
+            serde_json::to_string(&hashed).unwrap(),
+            serde_json::to_string(&page).unwrap()
+        );
+
+        let changed = page.clone().with_title("Other Page".to_string());
+        assert_ne!(changed.definition_hash(), hash);
+        // the builders drop the kept hash, it would not match any more
+        let changed = hashed.clone().with_title("Other Page".to_string());
+        assert_eq!(changed.definition_hash, None);
+        assert_ne!(changed.definition_hash(), hash);
+
+        // where the page is stored is not part of its definition
+        let mut moved = hashed.clone().with_path("/other".to_string());
+        moved.store = "other".to_string();
+        assert_eq!(moved.definition_hash(), hash);
+
+        // moving a child up a level is a different page too
+        let child = Element::new("div".to_string(), HashMap::new(), "child".to_string());
+        let nested = page.clone().with_children(vec![Element::new(
+            "div".to_string(),
+            HashMap::new(),
+            "id".to_string(),
+        )
+        .with_children(vec![child.clone()])]);
+        let flat = page.with_children(vec![
+            Element::new("div".to_string(), HashMap::new(), "id".to_string()),
+            child,
+        ]);
+        assert_ne!(nested.definition_hash(), flat.definition_hash());
+    }
+
     #[test]
     fn test_meta_definition() {
         let meta = MetaDefinition {
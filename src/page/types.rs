@@ -6,6 +6,8 @@
 
 use poem_openapi::Object;
 use serde::{Deserialize, Serialize};
+use std::collections::hash_map::DefaultHasher;
+use std::hash::{Hash, Hasher};
 
 #[derive(Debug, Clone, Serialize, Deserialize, Object)]
 pub struct Widget {
@@ -92,13 +94,13 @@ pub struct StoreListResults {
 }
 
 /// A meta definition for page metadata
-#[derive(Debug, Clone, Serialize, Deserialize, Object)]
+#[derive(Debug, Clone, Hash, Serialize, Deserialize, Object)]
 pub struct MetaDefinition {
     pub name: String,
     pub content: String,
 }
 
-#[derive(Debug, Clone, Serialize, Deserialize, Object)]
+#[derive(Debug, Clone, Hash, Serialize, Deserialize, Object)]
 pub struct LinkDefinition {
     pub href: String,
     pub rel: String,
@@ -156,22 +158,62 @@ impl Element {
         self
     }
 
-    // Post read fix element, and recursively fix children.
+    // Post read fix element, and all its children.
     pub fn fix(mut self) -> Self {
+        Self::fix_tree(std::slice::from_mut(&mut self));
+        self
+    }
+
+    /// Fixes the elements and all their descendants in place. Uses an explicit
+    /// stack, so deep pages neither recurse nor rebuild the children vectors.
+    fn fix_tree(elements: &mut [Element]) {
+        let mut stack: Vec<&mut Element> = elements.iter_mut().collect();
+        while let Some(element) = stack.pop() {
+            element.fix_id();
+            stack.extend(element.children.iter_mut());
+        }
+    }
+
+    /// Hashes the elements and all their descendants, see `Page::definition_hash`
+    fn hash_definitions<H: Hasher>(elements: &[Element], state: &mut H) {
+        // explicit stack, as for fix_tree; the counts keep the tree shape in the hash
+        let mut stack: Vec<&Element> = elements.iter().rev().collect();
+        elements.len().hash(state);
+        while let Some(element) = stack.pop() {
+            element.id.hash(state);
+            element.widget.hash(state);
+            hash_sorted_map(&element.data, state);
+            hash_sorted_map(&element.style, state);
+            element.classes.hash(state);
+            element.children.len().hash(state);
+            stack.extend(element.children.iter().rev());
+        }
+    }
+
+    fn fix_id(&mut self) {
         // check if the id is valid
         if self.id.is_empty() {
-            self.id = uuid::Uuid::new_v4().to_string();
+            // format the uuid on the stack, so the id is allocated once, already prefixed
+            let mut buffer = uuid::Uuid::encode_buffer();
+            let uuid = uuid::Uuid::new_v4().hyphenated().encode_lower(&mut buffer);
+            let mut id = String::with_capacity(uuid.len() + 3);
             // id can not start with a number
-            if self.id.chars().next().unwrap().is_digit(10) {
-                self.id = "id_".to_string() + &self.id;
+            if uuid.starts_with(|c: char| c.is_ascii_digit()) {
+                id.push_str("id_");
             }
+            id.push_str(uuid);
+            self.id = id;
         }
-        self.children = self.children.into_iter().map(|child| child.fix()).collect();
-
-        self
     }
 }
 
+/// Hashes the map entries in key order, as maps iterate in any order
+fn hash_sorted_map<H: Hasher>(map: &std::collections::HashMap<String, String>, state: &mut H) {
+    let mut entries: Vec<(&String, &String)> = map.iter().collect();
+    entries.sort_unstable();
+    entries.hash(state);
+}
+
 /// The page definition, with a title, and a list of blocks
 #[derive(Debug, Clone, Serialize, Deserialize, Object)]
 pub struct Page {
@@ -192,9 +234,14 @@ pub struct Page {
     pub head: Option<PageHead>,
     #[serde(default)]
     pub css_variables: std::collections::HashMap<String, String>,
+    /// Hash of the definition, kept by the stores that cache parsed pages, so
+    /// it is not worked out again on every request
+    #[serde(skip)]
+    #[oai(skip)]
+    pub definition_hash: Option<u64>,
 }
 
-#[derive(Debug, Clone, Serialize, Deserialize, Object)]
+#[derive(Debug, Clone, Hash, Serialize, Deserialize, Object)]
 pub struct PageHead {
     pub meta: Option<Vec<MetaDefinition>>,
     pub link: Option<Vec<LinkDefinition>>,
@@ -222,43 +269,86 @@ impl Page {
             last_modified: None,
             head: None,
             css_variables: std::collections::HashMap::new(),
+            definition_hash: None,
         }
     }
 
     pub fn with_title(mut self, title: String) -> Self {
         self.title = title;
+        self.definition_hash = None;
         self
     }
 
     pub fn with_path(mut self, path: String) -> Self {
         self.path = path;
+        self.definition_hash = None;
         self
     }
 
     pub fn with_url(mut self, url: String) -> Self {
         self.url = Some(url);
+        self.definition_hash = None;
         self
     }
 
     pub fn with_template(mut self, template: String) -> Self {
         self.template = Some(template);
+        self.definition_hash = None;
         self
     }
 
     pub fn with_children(mut self, children: Vec<Element>) -> Self {
         self.children = children;
+        self.definition_hash = None;
         self
     }
 
     pub fn with_head(mut self, head: PageHead) -> Self {
         self.head = Some(head);
+        self.definition_hash = None;
         self
     }
 
     pub fn fix(mut self) -> Self {
-        self.children = self.children.into_iter().map(|child| child.fix()).collect();
+        Element::fix_tree(&mut self.children);
+        // elements without an id got a new one
+        self.definition_hash = None;
+        self
+    }
+
+    /// Hash of the page definition, the same for the same definition, wherever
+    /// it is stored. Uses the one kept by `with_definition_hash` if any.
+    pub fn definition_hash(&self) -> u64 {
+        if let Some(hash) = self.definition_hash {
+            return hash;
+        }
+        let mut hasher = DefaultHasher::new();
+        self.hash_definition(&mut hasher);
+        hasher.finish()
+    }
+
+    /// Works out the definition hash and keeps it in the page. Only for pages
+    /// that will not be changed any more, as when cached by a store. The
+    /// builders drop it, but direct field changes do not.
+    pub fn with_definition_hash(mut self) -> Self {
+        self.definition_hash = Some(self.definition_hash());
         self
     }
+
+    /// Hashes every serialized field straight from the page, with no JSON in
+    /// between. Only the maps need sorting, to hash the same in any order.
+    /// `store` and `path` are left out: they are where the page was loaded
+    /// from, set by the store factory after the store kept the hash.
+    fn hash_definition<H: Hasher>(&self, state: &mut H) {
+        self.title.hash(state);
+        self.url.hash(state);
+        self.template.hash(state);
+        Element::hash_definitions(&self.children, state);
+        self.cache.hash(state);
+        self.last_modified.hash(state);
+        self.head.hash(state);
+        hash_sorted_map(&self.css_variables, state);
+    }
 }
 
 /// A page info, with a title, and a url
@@ -7,6 +7,7 @@
 pub mod pdf;
 pub mod renderedpage;
 pub mod renderer;
+pub mod templates;
 
 #[cfg(test)]
 mod tests;
@@ -4,17 +4,86 @@
 // A commercial license on request is also available;
 // contact info@coralbits.com for details.
 
+use std::borrow::Cow;
 use std::collections::HashMap;
+use std::fmt::Write;
+use std::sync::Arc;
 
 use crate::{
-    code::CodeStore,
+    code::{CodeStore, CHILDREN_TEMPLATE},
     page::types::{Element, Page, PageHead, Widget},
+    renderer::templates::TemplateSources,
     store::traits::Store,
 };
 
 use minijinja::{context, Environment, HtmlEscape};
 use tracing::{debug, error};
 
+/// A widget resolved for a page render, with what is needed to render it
+struct LoadedWidget {
+    widget: Arc<Widget>,
+    /// Name of its template in the shared template sources
+    template_name: Option<String>,
+    /// Whether it adds values to the context of its children
+    adds_context: bool,
+    output: WidgetOutput,
+    /// Whether its CSS is already in the rendered page
+    css_added: bool,
+}
+
+/// How the output of a widget is made, worked out when it is loaded
+#[derive(Clone, Copy, PartialEq)]
+enum WidgetOutput {
+    /// Rendering its template
+    Template,
+    /// Its template just outputs its children, in order, so they are joined
+    Children,
+    /// Its template has no template syntax at all, so it is output as is
+    Static,
+}
+
+impl WidgetOutput {
+    fn of(html: &str) -> Self {
+        if html == CHILDREN_TEMPLATE {
+            WidgetOutput::Children
+        } else if !has_template_tag(html, b"{%#") {
+            WidgetOutput::Static
+        } else {
+            WidgetOutput::Template
+        }
+    }
+}
+
+/// Whether the text has any of the template tags that start with `{` and one
+/// of `tags`. Looks at each `{` once, instead of searching the text per tag.
+fn has_template_tag(text: &str, tags: &[u8]) -> bool {
+    text.match_indices('{')
+        .any(|(i, _)| text.as_bytes().get(i + 1).is_some_and(|c| tags.contains(c)))
+}
+
+/// What rendering a template without template syntax outputs: the source,
+/// minus one trailing newline, as minijinja trims it
+fn static_output(html: &str) -> &str {
+    let html = html.strip_suffix('\n').unwrap_or(html);
+    html.strip_suffix('\r').unwrap_or(html)
+}
+
+/// Bytes of the `key: value;` CSS line for an element style entry, without building it
+fn style_line<'a>(key: &'a str, value: &'a str) -> impl Iterator<Item = u8> + 'a {
+    key.bytes()
+        .chain(*b": ")
+        .chain(value.bytes())
+        .chain(Some(b';'))
+}
+
+/// Pending work while rendering an element tree
+enum RenderStep<'e> {
+    /// Resolve the widget and the context for the children
+    Enter(&'e Element, minijinja::Value),
+    /// Render the widget, once all its children are rendered
+    Exit(&'e Element, Arc<Widget>, WidgetOutput, minijinja::Value),
+}
+
 #[derive(Debug)]
 pub struct RenderedPage {
     pub path: String,
@@ -45,67 +114,140 @@ impl RenderedPage {
         }
     }
 
+    /// Copy of the rendered output, to keep it for later requests. Errors are
+    /// not copied, and the copy is timed from now.
+    pub fn copy_output(&self) -> RenderedPage {
+        Self {
+            path: self.path.clone(),
+            store: self.store.clone(),
+            title: self.title.clone(),
+            body: self.body.clone(),
+            headers: self.headers.clone(),
+            response_code: self.response_code,
+            head: self.head.clone(),
+            css_variables: self.css_variables.clone(),
+            errors: Vec::new(),
+            elapsed: std::time::Instant::now(),
+        }
+    }
+
+    /// Adds the CSS of a widget or class, once per page.
+    ///
+    /// The same widget or class is used by many elements, and its CSS is
+    /// always the same, so only the first one pays for the key and the copy.
+    pub fn add_css_variable(&mut self, name: &str, css: &str) {
+        let mut key = String::with_capacity(name.len() + 2);
+        key.push_str("--");
+        key.push_str(name);
+        self.css_variables
+            .entry(key)
+            .or_insert_with(|| css.to_string());
+    }
+
     pub fn get_css(&self) -> String {
+        // Widget and class CSS goes as is, only element styles need a rule around them
         let mut css_variables = self
             .css_variables
             .iter()
             .map(|(k, v)| {
                 if k.starts_with("--") {
-                    v.clone()
+                    Cow::Borrowed(v.as_str())
                 } else {
-                    format!("{} {{\n {}\n }}\n", k, v)
+                    Cow::Owned(format!("{} {{\n {}\n }}\n", k, v))
                 }
             })
-            .collect::<Vec<String>>();
-        css_variables.sort_by(|a, b| a.cmp(b));
-        let css_variables = css_variables.join("\n");
+            .collect::<Vec<Cow<str>>>();
+        css_variables.sort_unstable();
+        // widgets and classes often share the same CSS, or have none; once is enough
+        css_variables.dedup();
         let base_css = "body { margin: 0; padding: 0; background: white; color: black; }";
 
-        format!("{}{}", css_variables, base_css)
+        let size = css_variables.iter().map(|css| css.len() + 1).sum::<usize>() + base_css.len();
+        let mut css = String::with_capacity(size);
+        for (i, variable) in css_variables.iter().enumerate() {
+            if i > 0 {
+                css.push('\n');
+            }
+            css.push_str(variable);
+        }
+        css.push_str(base_css);
+        css
     }
 
     pub fn get_head(&self) -> String {
-        let mut head = String::new();
-        head.push_str("<style>");
-        head.push_str(&self.get_css());
-        head.push_str("</style>");
+        let css = self.get_css();
+        let mut head = String::with_capacity(self.head_len(&css));
+        self.push_head(&mut head, &css);
+        head
+    }
+
+    /// Length of what `push_head` writes, to allocate for it at once
+    fn head_len(&self, css: &str) -> usize {
+        const STYLE_TAGS: usize = "<style></style>".len();
+        const META_TAG: usize = "<meta name=\"\" content=\"\">".len();
+        const LINK_TAG: usize = "<link rel=\"\" href=\"\">".len();
+
+        let metas = self
+            .head
+            .meta
+            .iter()
+            .flatten()
+            .map(|meta| META_TAG + meta.name.len() + meta.content.len());
+        let links = self
+            .head
+            .link
+            .iter()
+            .flatten()
+            .map(|link| LINK_TAG + link.rel.len() + link.href.len());
+        STYLE_TAGS + css.len() + metas.sum::<usize>() + links.sum::<usize>()
+    }
+
+    /// Writes the head contents to `out`, with the page CSS already worked out
+    fn push_head(&self, out: &mut String, css: &str) {
+        out.push_str("<style>");
+        out.push_str(css);
+        out.push_str("</style>");
         if let Some(metas) = &self.head.meta {
             for meta in metas {
-                head.push_str(&format!(
+                let _ = write!(
+                    out,
                     "<meta name=\"{}\" content=\"{}\">",
                     meta.name, meta.content
-                ));
+                );
             }
         }
 
         if let Some(links) = &self.head.link {
             for link in links {
-                head.push_str(&format!(
-                    "<link rel=\"{}\" href=\"{}\">",
-                    link.rel, link.href
-                ));
+                let _ = write!(out, "<link rel=\"{}\" href=\"{}\">", link.rel, link.href);
             }
         }
-
-        head
     }
 
     pub fn render_full_html_page(&self) -> String {
-        let head = self.get_head();
-        let html = format!(
-            r#"
+        const HTML_START: &str = r#"
 <!DOCTYPE html>
 <html>
 <head>
 <meta name="viewport" content="width=device-width, initial-scale=1.0">
-{}
-</head>
-<body>
-{}
-</body>
-</html>"#,
-            head, self.body
+"#;
+        const HTML_BODY: &str = "\n</head>\n<body>\n";
+        const HTML_END: &str = "\n</body>\n</html>";
+
+        // the head is written in place, so the CSS is copied once, into the page
+        let css = self.get_css();
+        let mut html = String::with_capacity(
+            HTML_START.len()
+                + self.head_len(&css)
+                + HTML_BODY.len()
+                + self.body.len()
+                + HTML_END.len(),
         );
+        html.push_str(HTML_START);
+        self.push_head(&mut html, &css);
+        html.push_str(HTML_BODY);
+        html.push_str(&self.body);
+        html.push_str(HTML_END);
         html
     }
 }
@@ -114,6 +256,14 @@ pub struct RenderedingPageData<'a> {
     page: &'a Page,
     store: &'a dyn Store,
     env: &'a Environment<'a>,
+    templates: Option<&'a TemplateSources>,
+    /// Widgets already loaded from the stores, by widget path
+    preloaded_widgets: Option<&'a HashMap<String, Arc<Widget>>>,
+    /// Widgets used in this page, by element widget path
+    widgets: HashMap<String, LoadedWidget>,
+    css_class_names: HashMap<String, String>,
+    /// url_context URLs that could not be prefetched, with their errors
+    failed_urls: HashMap<String, String>,
     pub rendered_page: RenderedPage,
     debug: bool,
 }
@@ -128,21 +278,41 @@ impl<'a> RenderedingPageData<'a> {
             page: page,
             store: store,
             env: env,
+            templates: None,
+            preloaded_widgets: None,
+            widgets: HashMap::new(),
+            css_class_names: HashMap::new(),
+            failed_urls: HashMap::new(),
             rendered_page,
             debug: false,
         }
     }
 
+    /// Compile widget templates through `env`'s loader, so they are reused
+    /// between renders. The environment must use `templates.loader()`.
+    pub fn with_templates(mut self, templates: &'a TemplateSources) -> Self {
+        self.templates = Some(templates);
+        self
+    }
+
+    /// Take widgets from `widgets`, by path, before asking the store for them
+    pub fn with_preloaded_widgets(mut self, widgets: &'a HashMap<String, Arc<Widget>>) -> Self {
+        self.preloaded_widgets = Some(widgets);
+        self
+    }
+
     pub fn with_debug(mut self, debug: bool) -> Self {
         self.debug = debug;
         self
     }
 
     pub async fn render(&mut self, ctx: &minijinja::Value) -> anyhow::Result<()> {
-        let mut rendered_body = String::new();
+        self.failed_urls = CodeStore::prefetch_url_contexts(&self.page.children).await;
+
+        // joined once at the end, into a string of the exact size
+        let mut rendered_elements = Vec::with_capacity(self.page.children.len());
         for element in &self.page.children {
-            debug!("Rendering element: {:?}", element.widget);
-            rendered_body.push_str(&self.render_element(element, ctx).await?);
+            rendered_elements.push(self.render_element(element, ctx).await?);
         }
 
         debug!(
@@ -159,78 +329,150 @@ impl<'a> RenderedingPageData<'a> {
             }
         }
 
-        self.rendered_page.body = rendered_body;
+        self.rendered_page.body = rendered_elements.concat();
 
         Ok(())
     }
 
+    /// Renders the element and all its children.
+    ///
+    /// Walks the tree with an explicit stack instead of recursing: each element
+    /// is entered to resolve its widget and the context for its children, and
+    /// rendered once all its children are, taking their output from `rendered`.
     pub async fn render_element(
         &mut self,
         element: &Element,
         ctx: &minijinja::Value,
     ) -> anyhow::Result<String> {
-        let widget = self.store.load_widget_definition(&element.widget).await?;
-        let widget = match widget {
-            Some(widget) => widget,
-            None => return Err(anyhow::anyhow!("Widget not found: {}", element.widget)),
-        };
-
-        // TODO is forcing create a clone always, when in most cases is not needed. But have lifetime problems if not.
-        // Also not best way to get the widget type
-        let ctx = if widget.name == "static_context" || widget.name == "url_context" {
-            debug!("Getting static context for element: {:?}", element.widget);
-            let ctx = match CodeStore::get_nested_widget_context(element, &ctx).await {
-                Ok(ctx) => ctx,
-                Err(e) => {
-                    error!(
-                        "Error getting static context for element: {:?}: {}",
-                        element.widget, e
-                    );
-                    if self.debug {
-                        return Ok(format!(
-                            "<pre style=\"color:red;\">{}</pre>",
-                            HtmlEscape(&e.to_string()).to_string()
-                        ));
+        let mut steps = vec![RenderStep::Enter(element, ctx.clone())];
+        let mut rendered: Vec<String> = Vec::new();
+
+        while let Some(step) = steps.pop() {
+            match step {
+                RenderStep::Enter(element, ctx) => {
+                    let (widget, adds_context, output) = self.load_widget(&element.widget).await?;
+
+                    let ctx = if adds_context {
+                        debug!("Getting static context for element: {:?}", element.widget);
+                        match CodeStore::get_nested_widget_context(element, &ctx, &self.failed_urls)
+                            .await
+                        {
+                            Ok(ctx) => ctx,
+                            Err(e) => {
+                                error!(
+                                    "Error getting static context for element: {:?}: {}",
+                                    element.widget, e
+                                );
+                                if self.debug {
+                                    rendered.push(format!(
+                                        "<pre style=\"color:red;\">{}</pre>",
+                                        HtmlEscape(&e.to_string())
+                                    ));
+                                    continue;
+                                }
+                                return Err(e);
+                            }
+                        }
+                    } else {
+                        ctx
+                    };
+
+                    // children are popped, so rendered, in order, and before their parent
+                    steps.push(RenderStep::Exit(element, widget, output, ctx.clone()));
+                    for child in element.children.iter().rev() {
+                        steps.push(RenderStep::Enter(child, ctx.clone()));
                     }
-                    return Err(e);
                 }
-            };
-            ctx
-        } else {
-            ctx.clone()
-        };
+                RenderStep::Exit(element, widget, output, ctx) => {
+                    let first_child = rendered.len() - element.children.len();
+
+                    // widgets that only output their children, or a fixed text, need no template
+                    if output != WidgetOutput::Template && element.classes.is_empty() {
+                        let rendered_text: String = match output {
+                            WidgetOutput::Static => {
+                                rendered.truncate(first_child);
+                                static_output(&widget.html).to_string()
+                            }
+                            _ => rendered.drain(first_child..).collect(),
+                        };
+                        self.add_element_css(&widget, element);
+                        rendered.push(rendered_text);
+                        continue;
+                    }
 
-        // Render recursively all the children, and add to context.children as a list
-        let mut children = Vec::new();
-        for child in &element.children {
-            debug!("Rendering child: {:?}", child.widget);
-            let rendered_child = Box::pin(self.render_element(child, &ctx)).await?;
-            children.push(rendered_child);
+                    // move the children output straight into a template value, no intermediate list.
+                    // It is already HTML, so mark it safe to never escape it again.
+                    let children: minijinja::Value = rendered
+                        .drain(first_child..)
+                        .map(minijinja::Value::from_safe_string)
+                        .collect();
+                    let render_ctx = context! { ..ctx, ..context!{children => children} };
+
+                    let rendered_element = self.render_widget(&widget, element, render_ctx).await;
+
+                    let rendered_text = match rendered_element {
+                        Ok(rendered_element) => rendered_element,
+                        Err(e) => {
+                            if self.debug {
+                                let ret = format!(
+                                    "<pre style=\"color:red;\">{}</pre>",
+                                    HtmlEscape(&e.to_string())
+                                );
+                                self.rendered_page.errors.push(e);
+                                ret
+                            } else {
+                                // on no debug, just return an error when rendering a failed widget
+                                return Err(e);
+                            }
+                        }
+                    };
+                    rendered.push(rendered_text);
+                }
+            }
         }
-        let render_ctx = context! { ..ctx, ..context!{children => children} };
 
-        let rendered_element = self.render_widget(&widget, element, render_ctx).await;
+        Ok(rendered.pop().unwrap_or_default())
+    }
 
-        let rendered_text = match rendered_element {
-            Ok(rendered_element) => rendered_element,
-            Err(e) => {
-                if self.debug {
-                    let ret = format!(
-                        "<pre style=\"color:red;\">{}</pre>",
-                        HtmlEscape(&e.to_string()).to_string()
-                    );
-                    self.rendered_page.errors.push(e);
-                    ret
-                } else {
-                    // on no debug, just return an error when rendering a failed widget
-                    return Err(e);
-                }
-            }
+    /// Gets a widget definition, whether it adds values to its children
+    /// context, and how its output is made. The store is asked only the first
+    /// time the widget is used in this page, and everything per widget is
+    /// worked out then.
+    async fn load_widget(
+        &mut self,
+        name: &str,
+    ) -> anyhow::Result<(Arc<Widget>, bool, WidgetOutput)> {
+        if let Some(loaded) = self.widgets.get(name) {
+            return Ok((loaded.widget.clone(), loaded.adds_context, loaded.output));
+        }
+        let preloaded = self
+            .preloaded_widgets
+            .and_then(|widgets| widgets.get(name))
+            .cloned();
+        let widget = match preloaded {
+            Some(widget) => widget,
+            None => match self.store.load_widget_definition(name).await? {
+                Some(widget) => Arc::new(widget),
+                None => return Err(anyhow::anyhow!("Widget not found: {}", name)),
+            },
         };
-
-        Ok(rendered_text)
+        let loaded = LoadedWidget {
+            widget: widget.clone(),
+            template_name: self
+                .templates
+                .and_then(|templates| templates.register(&widget.html)),
+            adds_context: CodeStore::is_context_widget(&widget.name),
+            output: WidgetOutput::of(&widget.html),
+            css_added: false,
+        };
+        let (adds_context, output) = (loaded.adds_context, loaded.output);
+        self.widgets.insert(name.to_string(), loaded);
+        Ok((widget, adds_context, output))
     }
 
+    /// Renders a single widget for the element. `ctx` must already have the
+    /// element's children, and for context widgets the values they add, as
+    /// `render_element` resolves them in its walk.
     pub async fn render_widget(
         &mut self,
         widget: &Widget,
@@ -239,13 +481,18 @@ impl<'a> RenderedingPageData<'a> {
     ) -> anyhow::Result<String> {
         debug!("Rendering widget: {:?}", widget.name);
 
-        let template = self.env.template_from_str(&widget.html)?;
-
-        let ctx = if widget.name == "static_context" || widget.name == "url_context" {
-            debug!("Getting static context for element: {:?}", element.widget);
-            CodeStore::get_nested_widget_context(element, &ctx).await?
-        } else {
-            ctx
+        let template_name = match self.widgets.get(&element.widget) {
+            Some(loaded) if std::ptr::eq(loaded.widget.as_ref(), widget) => {
+                loaded.template_name.as_deref().map(Cow::Borrowed)
+            }
+            _ => self
+                .templates
+                .and_then(|templates| templates.register(&widget.html))
+                .map(Cow::Owned),
+        };
+        let template = match template_name {
+            Some(name) => self.env.get_template(&name)?,
+            None => self.env.template_from_str(&widget.html)?,
         };
 
         let ctx = if element.classes.is_empty() {
@@ -254,11 +501,16 @@ impl<'a> RenderedingPageData<'a> {
             let mut classes = vec![];
 
             for class in &element.classes {
+                // its CSS was added to the page the first time the class was used
+                if let Some(name) = self.css_class_names.get(class) {
+                    classes.push(name.clone());
+                    continue;
+                }
                 if let Some(classdef) = self.store.load_css_class_definition(class).await? {
-                    self.rendered_page
-                        .css_variables
-                        .insert(format!("--{}", class), classdef.css.clone());
-                    classes.push(classdef.name.clone());
+                    self.rendered_page.add_css_variable(class, &classdef.css);
+                    self.css_class_names
+                        .insert(class.clone(), classdef.name.clone());
+                    classes.push(classdef.name);
                 } else {
                     error!("CSS class not found: {}", class);
                     return Err(anyhow::anyhow!("CSS class not found: {}", class));
@@ -283,16 +535,26 @@ impl<'a> RenderedingPageData<'a> {
             context => ctx
         };
 
-        // this should be some if, not every element should have this
-        let templated_context = Self::render_data_context(&element.data, non_templated_context)?;
-        let render_ctx = context! {
-            data => context!{
-                ..minijinja::Value::from_serialize(templated_context),
-                ..context! {
-                    id => &element.id,
-                }
-            },
-            context => ctx
+        // data values may be templates themselves, rendered with the plain data.
+        // Most elements have none, and render with the plain data as is.
+        let render_ctx = if element
+            .data
+            .values()
+            .any(|value| has_template_tag(value, b"{%"))
+        {
+            let templated_context =
+                self.render_data_context(&element.data, non_templated_context)?;
+            context! {
+                data => context!{
+                    ..minijinja::Value::from_serialize(templated_context),
+                    ..context! {
+                        id => &element.id,
+                    }
+                },
+                context => ctx
+            }
+        } else {
+            non_templated_context
         };
 
         // debug!("Render context: {:?}", render_ctx);
@@ -311,55 +573,89 @@ impl<'a> RenderedingPageData<'a> {
                 ));
             }
         };
-        debug!("Rendered element: {:?}", rendered_element);
+        debug!(
+            "Rendered widget={}, length={}",
+            widget.name,
+            rendered_element.len()
+        );
 
-        // Add the CSS to the rendered page
-        self.rendered_page
-            .css_variables
-            .insert(format!("--{}", widget.name), widget.css.clone());
+        self.add_element_css(widget, element);
 
-        // If the element has an id, add the CSS to the rendered page
-        if !element.id.is_empty() && !element.style.is_empty() {
-            let mut css = element
-                .style
-                .iter()
-                .map(|(k, v)| format!("{}: {};", k, v))
-                .collect::<Vec<String>>();
-            css.sort_by(|a, b| b.cmp(a));
-            let css = css.join("\n");
+        Ok(rendered_element)
+    }
 
+    /// Adds the CSS of the widget, and the element own style, to the rendered page
+    fn add_element_css(&mut self, widget: &Widget, element: &Element) {
+        // the widget CSS key is built only for the first element of each widget
+        let css_added = match self.widgets.get_mut(&element.widget) {
+            Some(loaded) if std::ptr::eq(loaded.widget.as_ref(), widget) => {
+                std::mem::replace(&mut loaded.css_added, true)
+            }
+            _ => false,
+        };
+        if !css_added {
             self.rendered_page
-                .css_variables
-                .insert(format!("#{}", element.id), css);
+                .add_css_variable(&widget.name, &widget.css);
         }
 
-        Ok(rendered_element)
+        // If the element has an id, add the CSS to the rendered page
+        if !element.id.is_empty() && !element.style.is_empty() {
+            // same order as sorting the formatted lines backwards, but comparing in place
+            let mut style: Vec<(&String, &String)> = element.style.iter().collect();
+            style.sort_unstable_by(|(a_key, a_value), (b_key, b_value)| {
+                style_line(b_key, b_value).cmp(style_line(a_key, a_value))
+            });
+
+            // write all the lines into one buffer, instead of a string per line and a join
+            let length: usize = style.iter().map(|(k, v)| k.len() + v.len() + 4).sum();
+            let mut css = String::with_capacity(length);
+            for (k, v) in style {
+                if !css.is_empty() {
+                    css.push('\n');
+                }
+                css.push_str(k);
+                css.push_str(": ");
+                css.push_str(v);
+                css.push(';');
+            }
+
+            let mut key = String::with_capacity(element.id.len() + 1);
+            key.push('#');
+            key.push_str(&element.id);
+            self.rendered_page.css_variables.insert(key, css);
+        }
     }
 
-    fn render_data_context(
-        data: &HashMap<String, String>,
+    fn render_data_context<'d>(
+        &self,
+        data: &'d HashMap<String, String>,
         ctx: minijinja::Value,
-    ) -> anyhow::Result<HashMap<String, String>> {
-        let mut result = HashMap::new();
+    ) -> anyhow::Result<HashMap<&'d str, Cow<'d, str>>> {
+        let mut result = HashMap::with_capacity(data.len());
 
         for (k, v) in data {
-            let rendered_v = Self::render_data_context_str(v, ctx.clone())?;
-            result.insert(k.clone(), rendered_v);
+            let rendered_v = self.render_data_context_str(v, ctx.clone())?;
+            result.insert(k.as_str(), rendered_v);
         }
 
         Ok(result)
     }
 
-    fn render_data_context_str(data: &String, ctx: minijinja::Value) -> anyhow::Result<String> {
+    /// Renders the data value if it is a template, or borrows it as is
+    fn render_data_context_str<'d>(
+        &self,
+        data: &'d str,
+        ctx: minijinja::Value,
+    ) -> anyhow::Result<Cow<'d, str>> {
         // debug!("Rendering data context: {:?}", ctx);
-        if data.contains("{{") || data.contains("{%") {
-            let env = minijinja::Environment::new();
-            let template = env.template_from_str(data)?;
-            let rendered_data = template.render(ctx)?;
+        if has_template_tag(data, b"{%") {
+            // compiled for this use only: data comes from page contents, even from anonymous
+            // POST /render bodies, so keeping it would grow the environment without bound
+            let rendered_data = self.env.render_str(data, ctx)?;
             debug!("Rendered data: {:?} -> {:?}", data, rendered_data);
-            Ok(rendered_data)
+            Ok(Cow::Owned(rendered_data))
         } else {
-            Ok(data.clone())
+            Ok(Cow::Borrowed(data))
         }
     }
 }
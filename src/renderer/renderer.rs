@@ -5,20 +5,32 @@
 // contact info@coralbits.com for details.
 
 use crate::{
-    page::types::Page,
-    renderer::renderedpage::{RenderedPage, RenderedingPageData},
-    store::factory::StoreFactory,
+    cache::lru::LruCache,
+    page::types::{Element, Page, Widget},
+    renderer::{
+        renderedpage::{RenderedPage, RenderedingPageData},
+        templates::TemplateSources,
+    },
+    store::{factory::StoreFactory, traits::Store},
     StoreConfig,
 };
 use anyhow::Result;
-use minijinja::Environment;
+use minijinja::{AutoEscape, Environment};
+use once_cell::sync::Lazy;
 use pulldown_cmark::{html::push_html, Parser};
+use std::collections::hash_map::DefaultHasher;
+use std::collections::{BTreeSet, HashMap};
+use std::hash::{Hash, Hasher};
+use std::sync::{Arc, Mutex};
 
-use tracing::instrument;
+use tracing::{info, instrument, warn};
 
 pub struct PageRenderer {
     pub store: StoreFactory,
     pub env: Environment<'static>,
+    pub(super) templates: TemplateSources,
+    /// Widgets of the stores, by path, loaded once with the stores
+    widgets: HashMap<String, Arc<Widget>>,
 }
 
 impl std::fmt::Debug for PageRenderer {
@@ -27,29 +39,151 @@ impl std::fmt::Debug for PageRenderer {
     }
 }
 
+/// Number of markdown conversions remembered by the markdown filter
+const MARKDOWN_CACHE_SIZE: usize = 1024;
+/// Most bytes of markdown and HTML kept by the markdown filter, all entries together
+const MARKDOWN_CACHE_MAX_BYTES: usize = 8 * 1024 * 1024;
+/// Longer markdown texts are converted every time, so a few big ones don't push out the rest
+const MARKDOWN_CACHE_MAX_LEN: usize = 16 * 1024;
+
+/// The same texts are rendered again and again, as in indexes or repeated page renders
+static MARKDOWN_CACHE: Lazy<Mutex<LruCache<String, String>>> = Lazy::new(|| {
+    Mutex::new(LruCache::new(MARKDOWN_CACHE_SIZE).with_max_weight(MARKDOWN_CACHE_MAX_BYTES))
+});
+
 fn markdown_to_html(markdown: &str) -> String {
-    let mut html = String::new();
+    let cacheable = markdown.len() <= MARKDOWN_CACHE_MAX_LEN;
+    if cacheable {
+        if let Some(html) = MARKDOWN_CACHE.lock().unwrap().get(markdown) {
+            return html.clone();
+        }
+    }
+
+    // HTML is a bit longer than its markdown source, reserve for it to avoid regrowing while pushing
+    let mut html = String::with_capacity(markdown.len() + markdown.len() / 2);
     let parser = Parser::new(markdown);
     push_html(&mut html, parser);
+
+    if cacheable {
+        let size = markdown.len() + html.len();
+        MARKDOWN_CACHE
+            .lock()
+            .unwrap()
+            .insert_weighted(markdown.to_string(), html.clone(), size);
+    }
     html
 }
 
 impl PageRenderer {
     pub fn new() -> Self {
         let store = StoreFactory::new();
+        let templates = TemplateSources::new();
         let mut env = Environment::new();
         env.add_filter("markdown", markdown_to_html);
+        // widgets output HTML from their data as is; rendered children are marked safe anyway
+        env.set_auto_escape_callback(|_| AutoEscape::None);
+        // widget templates are compiled once, and then reused from the environment
+        env.set_loader(templates.loader());
 
-        Self { store, env }
+        Self {
+            store,
+            env,
+            templates,
+            widgets: HashMap::new(),
+        }
     }
 
     pub async fn with_stores(mut self, stores: &[StoreConfig]) -> Result<Self> {
         for store in stores {
             self.store.add_store(StoreFactory::new_store(&store).await?);
         }
+        self.preload_widgets().await;
         Ok(self)
     }
 
+    /// Keeps all the widgets the stores know about, so page renders take them
+    /// from here instead of copying them out of the stores, and compiles their
+    /// templates, so the first renders after startup don't pay for it.
+    /// Compilation failures are only logged, as the widget will fail the same
+    /// way when rendered. Widgets of stores added later are loaded from them
+    /// on each render.
+    pub async fn preload_widgets(&mut self) {
+        let mut count = 0;
+        let store_names = self.store.get_store_list().await.unwrap_or_default();
+        for store_name in store_names {
+            let Some(store) = self.store.get_store(&store_name) else {
+                continue;
+            };
+            let widgets = match store.get_widget_list().await {
+                Ok(widgets) => widgets.results,
+                Err(e) => {
+                    warn!("Could not list widgets, store={}: {}", store_name, e);
+                    continue;
+                }
+            };
+            for widget in widgets {
+                let template_name = self.templates.register(&widget.html);
+                // first store wins on repeated names, as when loading them from the factory
+                let path = format!("{}/{}", store_name, widget.name);
+                let widget = self.widgets.entry(path).or_insert_with(|| Arc::new(widget));
+                let Some(template_name) = template_name else {
+                    continue;
+                };
+                match self.env.get_template(&template_name) {
+                    Ok(_) => count += 1,
+                    Err(e) => warn!(
+                        "Could not compile widget template, store={}, widget={}: {}",
+                        store_name, widget.name, e
+                    ),
+                }
+            }
+        }
+        info!(
+            "Preloaded widgets count={}, precompiled templates count={}",
+            self.widgets.len(),
+            count
+        );
+    }
+
+    /// Hash of the widget and CSS class definitions the page uses, as they are
+    /// part of its output as much as the page definition. Widgets are taken
+    /// from the preloaded ones when there, as when rendering, and the rest and
+    /// the classes from the stores. None if any of them can not be loaded, as
+    /// the render will fail on it.
+    pub async fn dependencies_hash(&self, page: &Page) -> Option<u64> {
+        // sorted and once each, so the hash does not depend on the page layout
+        let mut widgets = BTreeSet::new();
+        let mut classes = BTreeSet::new();
+        let mut stack: Vec<&Element> = page.children.iter().collect();
+        while let Some(element) = stack.pop() {
+            widgets.insert(element.widget.as_str());
+            classes.extend(element.classes.iter().map(String::as_str));
+            stack.extend(element.children.iter());
+        }
+
+        let mut hasher = DefaultHasher::new();
+        for path in widgets {
+            let loaded;
+            let widget = match self.widgets.get(path) {
+                Some(widget) => widget.as_ref(),
+                None => {
+                    loaded = self.store.load_widget_definition(path).await.ok()??;
+                    &loaded
+                }
+            };
+            path.hash(&mut hasher);
+            widget.html.hash(&mut hasher);
+            widget.css.hash(&mut hasher);
+        }
+        for class in classes {
+            let classdef = self.store.load_css_class_definition(class).await.ok()??;
+            class.hash(&mut hasher);
+            classdef.name.hash(&mut hasher);
+            classdef.css.hash(&mut hasher);
+        }
+        Some(hasher.finish())
+    }
+
     #[instrument(skip(self, page, ctx, debug), fields(page_path = page.path))]
     pub async fn render_page(
         &self,
@@ -57,8 +191,10 @@ impl PageRenderer {
         ctx: &minijinja::Value,
         debug: bool,
     ) -> anyhow::Result<RenderedPage> {
-        let mut rendering_page =
-            RenderedingPageData::new(&page, &self.store, &self.env).with_debug(debug);
+        let mut rendering_page = RenderedingPageData::new(&page, &self.store, &self.env)
+            .with_templates(&self.templates)
+            .with_preloaded_widgets(&self.widgets)
+            .with_debug(debug);
 
         rendering_page.render(ctx).await?;
         let rendered_page = rendering_page.rendered_page;
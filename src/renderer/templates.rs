@@ -0,0 +1,77 @@
+// (C) Coralbits SL 2025
+// This file is part of Coralpages and is licensed under the
+// GNU Affero General Public License v3.0.
+// A commercial license on request is also available;
+// contact info@coralbits.com for details.
+
+use std::collections::hash_map::DefaultHasher;
+use std::collections::HashMap;
+use std::hash::{Hash, Hasher};
+use std::sync::{Arc, RwLock};
+
+/// Most template sources kept. Only widget templates are kept, so this is well
+/// over what the stores hold; past this, new sources are compiled on every
+/// use instead of growing the environment for ever.
+const MAX_TEMPLATE_SOURCES: usize = 4096;
+
+/// Widget template sources known to the renderer environment.
+///
+/// Each distinct source is registered under a name derived from its contents,
+/// and the environment loader reads it from here. So minijinja compiles every
+/// template once, on first use, and reuses the compiled one afterwards.
+#[derive(Clone, Default)]
+pub struct TemplateSources {
+    sources: Arc<RwLock<HashMap<String, String>>>,
+}
+
+impl TemplateSources {
+    pub fn new() -> Self {
+        Self::default()
+    }
+
+    /// Registers the source if needed, and returns the name to get it from the
+    /// environment. Returns None on a (very unlikely) name collision, or if
+    /// there are too many sources already, in which case the caller should
+    /// compile the source directly.
+    pub fn register(&self, source: &str) -> Option<String> {
+        let name = Self::template_name(source);
+        if let Some(known) = self.sources.read().unwrap().get(&name) {
+            return if known == source { Some(name) } else { None };
+        }
+        let mut sources = self.sources.write().unwrap();
+        if sources.len() >= MAX_TEMPLATE_SOURCES && !sources.contains_key(&name) {
+            return None;
+        }
+        let known = sources
+            .entry(name.clone())
+            .or_insert_with(|| source.to_string());
+        if known == source {
+            Some(name)
+        } else {
+            None
+        }
+    }
+
+    /// Number of distinct sources registered
+    pub fn len(&self) -> usize {
+        self.sources.read().unwrap().len()
+    }
+
+    pub fn is_empty(&self) -> bool {
+        self.len() == 0
+    }
+
+    /// Loader for `Environment::set_loader`
+    pub fn loader(
+        &self,
+    ) -> impl Fn(&str) -> Result<Option<String>, minijinja::Error> + Send + Sync + 'static {
+        let sources = self.sources.clone();
+        move |name| Ok(sources.read().unwrap().get(name).cloned())
+    }
+
+    fn template_name(source: &str) -> String {
+        let mut hasher = DefaultHasher::new();
+        source.hash(&mut hasher);
+        format!("template-{:016x}", hasher.finish())
+    }
+}
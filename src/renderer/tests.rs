@@ -715,3 +715,148 @@ async fn test_performance_timing() {
 
     info!("Performance timing test: PASSED (took {:?})", elapsed);
 }
+
+#[tokio::test]
+async fn test_widget_templates_are_reused() {
+    let page = Page::new()
+        .with_title("Cached Templates".to_string())
+        .with_path("/cached".to_string())
+        .with_children(vec![
+            Element::new(
+                "test/text".to_string(),
+                HashMap::from([("text".to_string(), "First".to_string())]),
+                "cached-first".to_string(),
+            ),
+            Element::new(
+                "test/text".to_string(),
+                HashMap::from([("text".to_string(), "Second".to_string())]),
+                "cached-second".to_string(),
+            ),
+        ]);
+
+    let mut renderer = PageRenderer::new();
+    renderer.store.add_store(Box::new(TestStore::new()));
+
+    let first = renderer
+        .render_page(&page, &minijinja::context! {}, false)
+        .await
+        .unwrap();
+    // both elements use the same widget, so its template is registered once
+    assert_eq!(renderer.templates.len(), 1);
+
+    let second = renderer
+        .render_page(&page, &minijinja::context! {}, false)
+        .await
+        .unwrap();
+    // and the second render compiles nothing new
+    assert_eq!(renderer.templates.len(), 1);
+
+    assert_html_structure(&first.body, "First");
+    assert_html_structure(&first.body, "Second");
+    assert_eq!(first.body, second.body);
+
+    info!("Widget template reuse: PASSED");
+}
+
+#[tokio::test]
+async fn test_static_widget_output() {
+    let mut test_store = TestStore::new();
+    test_store.add_widget(
+        "divider",
+        "<hr class=\"divider\">\n",
+        ".divider { margin: 0; }",
+    );
+
+    let page = Page::new()
+        .with_title("Static Widget".to_string())
+        .with_path("/static".to_string())
+        .with_children(vec![Element::new(
+            "test/divider".to_string(),
+            HashMap::new(),
+            "divider-element".to_string(),
+        )]);
+
+    let mut renderer = PageRenderer::new();
+    renderer.store.add_store(Box::new(test_store));
+
+    let rendered_page = renderer
+        .render_page(&page, &minijinja::context! {}, false)
+        .await
+        .unwrap();
+
+    // same as rendering it as a template, which trims the trailing newline
+    assert_eq!(rendered_page.body, "<hr class=\"divider\">");
+    assert!(rendered_page.get_css().contains(".divider { margin: 0; }"));
+
+    info!("Static widget output: PASSED");
+}
+
+#[tokio::test]
+async fn test_dependencies_hash() {
+    let page = Page::new().with_children(vec![Element::new(
+        "test/text".to_string(),
+        HashMap::from([("text".to_string(), "Hello".to_string())]),
+        "dependencies-text".to_string(),
+    )
+    .with_classes(vec!["test/primary".to_string()])]);
+
+    let renderer_with = |css: &str| {
+        let mut test_store = TestStore::new();
+        test_store.add_widget("text", "<a>{{data.text}}</a>", css);
+        let mut renderer = PageRenderer::new();
+        renderer.store.add_store(Box::new(test_store));
+        renderer
+    };
+
+    let hash = renderer_with(".text {}").dependencies_hash(&page).await;
+    assert!(hash.is_some());
+    assert_eq!(
+        renderer_with(".text {}").dependencies_hash(&page).await,
+        hash
+    );
+    // same page, but its widget renders differently
+    assert_ne!(
+        renderer_with(".text { color: red; }")
+            .dependencies_hash(&page)
+            .await,
+        hash
+    );
+
+    // the render would fail, so there is nothing to hash
+    let missing = page.with_children(vec![Element::new(
+        "test/missing".to_string(),
+        HashMap::new(),
+        "dependencies-missing".to_string(),
+    )]);
+    assert_eq!(
+        renderer_with(".text {}").dependencies_hash(&missing).await,
+        None
+    );
+
+    info!("Dependencies hash: PASSED");
+}
+
+#[tokio::test]
+async fn test_data_templates_are_not_kept() {
+    let page = Page::new().with_children(vec![Element::new(
+        "test/text".to_string(),
+        HashMap::from([(
+            "text".to_string(),
+            "{% if true %}templated{% endif %}".to_string(),
+        )]),
+        "data-template".to_string(),
+    )]);
+
+    let mut renderer = PageRenderer::new();
+    renderer.store.add_store(Box::new(TestStore::new()));
+
+    let rendered = renderer
+        .render_page(&page, &minijinja::context! {}, false)
+        .await
+        .unwrap();
+    assert_html_structure(&rendered.body, "Hello, templated!");
+    // only the widget template is kept, data comes from the page and is compiled for each use
+    assert_eq!(renderer.templates.len(), 1);
+
+    info!("Data templates are not kept: PASSED");
+}
@@ -6,16 +6,23 @@
 
 use anyhow::Result;
 use minijinja::context;
+use once_cell::sync::Lazy;
 use poem::middleware::Cors;
 use poem::web::Redirect;
 use poem::{get, handler};
 use poem_openapi::payload::Binary;
+use std::collections::hash_map::DefaultHasher;
+use std::fmt::Write;
+use std::hash::{Hash, Hasher};
+use std::sync::Mutex;
 use std::{collections::HashMap, sync::Arc};
 use tokio::sync::broadcast;
 use tracing::{error, info};
 
+use crate::cache::lru::LruCache;
 use crate::page::types::ResultPageList;
 use crate::server::PageRenderResponse;
+use crate::store::code::CodeStore;
 use crate::traits::Store;
 use crate::{
     renderedpage::RenderedPage,
@@ -38,8 +45,18 @@ use poem_openapi::{
     OpenApi, OpenApiService,
 };
 
+/// Number of rendered pages kept, by ETag
+const RENDERED_CACHE_SIZE: usize = 256;
+/// Most bytes of body and CSS kept for rendered pages, all of them together
+const RENDERED_CACHE_MAX_BYTES: usize = 32 * 1024 * 1024;
+
 pub struct Api {
     renderer: Arc<PageRenderer>,
+    /// Last renders by page and ETag, see `rendered_cache_key`. Same ETag means
+    /// same output, so a client without a copy of the page gets this one
+    /// instead of a new render. Only pages that get an ETag are kept, see
+    /// `page_uses_etag`. Shared, so keeping and serving them copies nothing.
+    rendered: Mutex<LruCache<String, Arc<RenderedPage>>>,
 }
 
 #[OpenApi]
@@ -47,6 +64,9 @@ impl Api {
     pub fn new(renderer: PageRenderer) -> Result<Self> {
         Ok(Self {
             renderer: Arc::new(renderer),
+            rendered: Mutex::new(
+                LruCache::new(RENDERED_CACHE_SIZE).with_max_weight(RENDERED_CACHE_MAX_BYTES),
+            ),
         })
     }
 
@@ -145,22 +165,62 @@ impl Api {
                 )
             })?;
 
+        let debug = debug.unwrap_or(false);
+        let accept_type = self.accept_type(request, format, extension);
+
+        // Same page definition, widgets, classes, format and salt always render the same, so
+        // the client copy is good. Only for pages that ask for it, and never for those that
+        // fetch URLs while rendering, as what those return is not known until then.
+        // Taken before fixing the page, as that makes up random ids for elements without one.
+        let etag = if debug || !page_uses_etag(&page) {
+            None
+        } else {
+            match self.renderer.dependencies_hash(&page).await {
+                Some(dependencies) => {
+                    let etag_salt = crate::config::get_config().await.server.etag_salt.clone();
+                    Some(page_etag(&page, dependencies, &accept_type, &etag_salt))
+                }
+                None => None,
+            }
+        };
+        let cache_key = etag
+            .as_deref()
+            .map(|etag| rendered_cache_key(&page.store, &page.path, etag));
+        if let (Some(etag), Some(cache_key)) = (&etag, &cache_key) {
+            if etag_matches(request, etag) {
+                return Ok(PageRenderResponse::NotModified(etag.clone()));
+            }
+            let cached = self.rendered.lock().unwrap().get(cache_key).cloned();
+            if let Some(rendered) = cached {
+                return self
+                    .response(rendered, accept_type, Some(etag.clone()))
+                    .await;
+            }
+        }
         let page = page.fix();
 
         let ctx = context! {};
 
         let mut rendered = self
             .renderer
-            .render_page(&page, &ctx, debug.unwrap_or(false))
+            .render_page(&page, &ctx, debug)
             .await
             .map_err(|e| {
                 PoemError::from_string(e.to_string(), poem::http::StatusCode::INTERNAL_SERVER_ERROR)
             })?;
         rendered.store = page.store.clone();
         rendered.path = page.path.clone();
+        let rendered = Arc::new(rendered);
 
-        let accept_type = self.accept_type(request, format, extension);
-        return self.response(rendered, accept_type).await;
+        if let Some(cache_key) = cache_key {
+            let size = rendered_size(&rendered);
+            self.rendered
+                .lock()
+                .unwrap()
+                .insert_weighted(cache_key, rendered.clone(), size);
+        }
+
+        return self.response(rendered, accept_type, etag).await;
     }
 
     #[oai(path = "/render/", method = "post")]
@@ -193,7 +253,7 @@ impl Api {
         };
 
         let accept_type = self.accept_type(request, format, None);
-        return self.response(rendered, accept_type).await;
+        return self.response(Arc::new(rendered), accept_type, None).await;
     }
 
     fn accept_type(
@@ -248,26 +308,37 @@ impl Api {
         Ok(response)
     }
 
+    /// The response for the rendered page, in the accepted type. The page may be
+    /// shared with the rendered cache; only JSON needs it copied when it is.
     async fn response(
         &self,
-        rendered: RenderedPage,
+        rendered: Arc<RenderedPage>,
         accept_type: String,
+        etag: Option<String>,
     ) -> Result<PageRenderResponse, PoemError> {
         let response = match accept_type.as_str() {
-            "text/html" => PageRenderResponse::Html(PlainText(rendered.render_full_html_page())),
-            "text/css" => PageRenderResponse::Css(PlainText(rendered.get_css())),
-            "application/pdf" => {
-                PageRenderResponse::Pdf(Binary(render_pdf(&rendered).await.map_err(|e| {
+            "text/html" => {
+                PageRenderResponse::Html(PlainText(rendered.render_full_html_page()), etag)
+            }
+            "text/css" => PageRenderResponse::Css(PlainText(rendered.get_css()), etag),
+            "application/pdf" => PageRenderResponse::Pdf(
+                Binary(render_pdf(&rendered).await.map_err(|e| {
                     error!("Error rendering PDF: {:?}", e);
                     PoemError::from_string(
                         e.to_string(),
                         poem::http::StatusCode::INTERNAL_SERVER_ERROR,
                     )
-                })?))
+                })?),
+                etag,
+            ),
+            _ => {
+                let rendered =
+                    Arc::try_unwrap(rendered).unwrap_or_else(|shared| shared.copy_output());
+                PageRenderResponse::Json(
+                    Json(PageRenderResponseJson::from_page_rendered(rendered)),
+                    etag,
+                )
             }
-            _ => PageRenderResponse::Json(Json(PageRenderResponseJson::from_page_rendered(
-                &rendered,
-            ))),
         };
         Ok(response)
     }
@@ -574,6 +645,93 @@ async fn root_redirect() -> Redirect {
     return Redirect::moved_permanent("/api/v1/render/default/index?format=html");
 }
 
+/// Key of a rendered page in the rendered cache. The ETag covers where the
+/// page is too, but the key says it as is, so a page never gets another's.
+fn rendered_cache_key(store: &str, path: &str, etag: &str) -> String {
+    format!("{}/{} {}", store, path, etag)
+}
+
+/// Bytes a rendered page takes in the rendered cache, near enough
+fn rendered_size(rendered: &RenderedPage) -> usize {
+    let css: usize = rendered
+        .css_variables
+        .iter()
+        .map(|(key, css)| key.len() + css.len())
+        .sum();
+    rendered.title.len() + rendered.body.len() + css
+}
+
+/// Whether the page gets an ETag: it lists `etag` in its `cache` options, and
+/// does not depend on URL contents fetched at render time.
+fn page_uses_etag(page: &Page) -> bool {
+    page.cache.iter().any(|c| c == "etag") && !CodeStore::uses_url_context(&page.children)
+}
+
+/// ETag for a rendered page: a hash of where the page is, its definition,
+/// the definitions it uses (see `PageRenderer::dependencies_hash`), the
+/// response type and the configured salt, formatted as a date.
+fn page_etag(page: &Page, dependencies: u64, accept_type: &str, etag_salt: &str) -> String {
+    // usually kept from when the store parsed the page, so just a few bytes to hash here
+    let definition = page.definition_hash();
+
+    let salt = formatted_salt(etag_salt);
+
+    let mut hasher = DefaultHasher::new();
+    // not part of the definition hash, as the factory sets them after the store kept it
+    page.store.hash(&mut hasher);
+    page.path.hash(&mut hasher);
+    definition.hash(&mut hasher);
+    dependencies.hash(&mut hasher);
+    accept_type.hash(&mut hasher);
+    salt.hash(&mut hasher);
+    // weak, as elements without an id get a random one on each render, so the same
+    // tag stands for an equivalent page, not always for the same bytes
+    format!("W/\"{:016x}\"", hasher.finish())
+}
+
+/// Last formatted ETag salt: the second it was formatted in, the format, and the result
+static FORMATTED_SALT: Lazy<Mutex<(u64, String, String)>> =
+    Lazy::new(|| Mutex::new((0, String::new(), String::new())));
+
+/// The salt formatted as a date for now. Formatting dates is much more work
+/// than the rest of the ETag, and the result changes at most once a second for
+/// the formats that make sense, so it is reused within the same second.
+fn formatted_salt(etag_salt: &str) -> String {
+    if etag_salt.is_empty() {
+        return String::new();
+    }
+    let now = std::time::SystemTime::now()
+        .duration_since(std::time::UNIX_EPOCH)
+        .map_or(0, |elapsed| elapsed.as_secs());
+
+    let mut formatted = FORMATTED_SALT.lock().unwrap();
+    if formatted.0 == now && formatted.1 == etag_salt {
+        return formatted.2.clone();
+    }
+    let mut salt = String::new();
+    if write!(salt, "{}", chrono::Local::now().format(etag_salt)).is_err() {
+        salt = etag_salt.to_string();
+    }
+    *formatted = (now, etag_salt.to_string(), salt.clone());
+    salt
+}
+
+/// Whether the request If-None-Match has the ETag. Uses the weak comparison,
+/// as If-None-Match does, so `W/` prefixes are ignored; `*` matches any.
+fn etag_matches(request: &Request, etag: &str) -> bool {
+    let Some(if_none_match) = request.headers().get("If-None-Match") else {
+        return false;
+    };
+    let Ok(if_none_match) = if_none_match.to_str() else {
+        return false;
+    };
+    let etag = etag.trim_start_matches("W/");
+    if_none_match.split(',').any(|candidate| {
+        let candidate = candidate.trim();
+        candidate == "*" || candidate.trim_start_matches("W/") == etag
+    })
+}
+
 pub async fn start(listen: &str, renderer: PageRenderer) -> Result<()> {
     let (_, shutdown_rx) = broadcast::channel(1);
     start_with_shutdown(listen, renderer, shutdown_rx).await
@@ -615,3 +773,148 @@ pub async fn start_with_shutdown(
 
     Ok(())
 }
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+    use crate::store::file::FileStore;
+    use crate::StoreConfig;
+    use tempfile::TempDir;
+
+    /// Api over a file store named "test", with a page that asks for ETags, and one that does not
+    fn test_api() -> (TempDir, Api) {
+        let dir = TempDir::new().unwrap();
+        std::fs::write(
+            dir.path().join("cached.yaml"),
+            "title: Cached\ncache:\n  - etag\n",
+        )
+        .unwrap();
+        std::fs::write(dir.path().join("plain.yaml"), "title: Plain\n").unwrap();
+        let store = FileStore::new(&StoreConfig {
+            name: "test".to_string(),
+            store_type: "file".to_string(),
+            url: "".to_string(),
+            path: dir.path().to_string_lossy().to_string(),
+            tags: vec!["pages".to_string()],
+        })
+        .unwrap();
+
+        let mut renderer = PageRenderer::new();
+        renderer.store.add_store(Box::new(store));
+        (dir, Api::new(renderer).unwrap())
+    }
+
+    async fn render_html(api: &Api, path: &str, if_none_match: Option<&str>) -> PageRenderResponse {
+        let mut request = Request::builder();
+        if let Some(etag) = if_none_match {
+            request = request.header("If-None-Match", etag);
+        }
+        api.render(
+            &request.finish(),
+            Path("test".to_string()),
+            Path(path.to_string()),
+            Query(Some("html".to_string())),
+            Query(None),
+        )
+        .await
+        .unwrap()
+    }
+
+    fn request_with_if_none_match(if_none_match: &str) -> Request {
+        Request::builder()
+            .header("If-None-Match", if_none_match)
+            .finish()
+    }
+
+    #[test]
+    fn test_etag_matches() {
+        let etag = "W/\"00000000000000aa\"";
+        assert!(etag_matches(&request_with_if_none_match(etag), etag));
+        // weak comparison, with or without the W/ on either side
+        assert!(etag_matches(
+            &request_with_if_none_match("\"00000000000000aa\""),
+            etag
+        ));
+        assert!(etag_matches(
+            &request_with_if_none_match("\"00000000000000bb\", W/\"00000000000000aa\""),
+            etag
+        ));
+        assert!(etag_matches(&request_with_if_none_match("*"), etag));
+
+        assert!(!etag_matches(
+            &request_with_if_none_match("W/\"00000000000000bb\""),
+            etag
+        ));
+        assert!(!etag_matches(&Request::builder().finish(), etag));
+    }
+
+    #[tokio::test]
+    async fn test_etag_only_for_pages_that_ask() {
+        let (_dir, api) = test_api();
+
+        let PageRenderResponse::Html(_, etag) = render_html(&api, "plain", None).await else {
+            panic!("expected an HTML page");
+        };
+        assert_eq!(etag, None);
+        // and so never Not Modified
+        let response = render_html(&api, "plain", Some("*")).await;
+        assert!(matches!(response, PageRenderResponse::Html(_, None)));
+
+        let PageRenderResponse::Html(_, etag) = render_html(&api, "cached", None).await else {
+            panic!("expected an HTML page");
+        };
+        let etag = etag.expect("cache: [etag] pages get an ETag");
+        assert!(etag.starts_with("W/\""));
+    }
+
+    #[tokio::test]
+    async fn test_if_none_match_not_modified() {
+        let (_dir, api) = test_api();
+
+        let PageRenderResponse::Html(_, Some(etag)) = render_html(&api, "cached", None).await
+        else {
+            panic!("expected an HTML page with an ETag");
+        };
+        match render_html(&api, "cached", Some(&etag)).await {
+            PageRenderResponse::NotModified(not_modified) => assert_eq!(not_modified, etag),
+            _ => panic!("expected Not Modified"),
+        }
+        // another tag is a full response
+        let response = render_html(&api, "cached", Some("W/\"0000000000000000\"")).await;
+        assert!(matches!(response, PageRenderResponse::Html(_, Some(_))));
+    }
+
+    #[tokio::test]
+    async fn test_rendered_page_served_from_cache() {
+        let (_dir, api) = test_api();
+
+        let PageRenderResponse::Html(_, Some(etag)) = render_html(&api, "cached", None).await
+        else {
+            panic!("expected an HTML page with an ETag");
+        };
+        assert_eq!(api.rendered.lock().unwrap().len(), 1);
+
+        // swap the kept render for one the renderer would never make
+        let mut kept = RenderedPage::new();
+        kept.body = "<p>from the cache</p>".to_string();
+        api.rendered
+            .lock()
+            .unwrap()
+            .insert(rendered_cache_key("test", "cached", &etag), Arc::new(kept));
+
+        let PageRenderResponse::Html(PlainText(html), _) = render_html(&api, "cached", None).await
+        else {
+            panic!("expected an HTML page");
+        };
+        assert!(html.contains("<p>from the cache</p>"));
+    }
+
+    #[tokio::test]
+    async fn test_rendered_cache_only_for_pages_that_ask() {
+        let (_dir, api) = test_api();
+
+        render_html(&api, "plain", None).await;
+        render_html(&api, "plain", None).await;
+        assert!(api.rendered.lock().unwrap().is_empty());
+    }
+}
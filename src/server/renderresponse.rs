@@ -50,38 +50,33 @@ pub struct PageRenderResponseJson {
 }
 
 impl PageRenderResponseJson {
-    pub fn from_page_rendered(rendered: &RenderedPage) -> Self {
-        // let meta = rendered
-        //     .meta
-        //     .iter()
-        //     .map(|m| PageRenderMeta {
-        //         name: m.name.clone(),
-        //         content: m.content.clone(),
-        //     })
-        //     .collect();
-        let head = rendered.head.clone();
+    /// Builds the response moving the rendered strings, as the page is not needed afterwards
+    pub fn from_page_rendered(rendered: RenderedPage) -> Self {
+        let css = rendered.get_css();
+        let elapsed = rendered.elapsed.elapsed().as_micros() as f32 / 1000.0;
+        let head = rendered.head;
 
         Self {
-            body: rendered.body.clone(),
+            body: rendered.body,
             head: PageRenderHead {
-                css: rendered.get_css(),
+                css,
                 js: "/** TODO **/".to_string(),
                 meta: head
                     .meta
                     .unwrap_or_default()
-                    .iter()
+                    .into_iter()
                     .map(|m| PageRenderMeta {
-                        name: m.name.clone(),
-                        content: m.content.clone(),
+                        name: m.name,
+                        content: m.content,
                     })
                     .collect(),
                 link: head
                     .link
                     .unwrap_or_default()
-                    .iter()
+                    .into_iter()
                     .map(|l| PageRenderLink {
-                        href: l.href.clone(),
-                        rel: l.rel.clone(),
+                        href: l.href,
+                        rel: l.rel,
                     })
                     .collect(),
             },
@@ -89,10 +84,10 @@ impl PageRenderResponseJson {
                 headers: HashMap::new(),
                 response_code: 200,
             },
-            path: rendered.path.clone(),
-            store: rendered.store.clone(),
-            title: rendered.title.clone(),
-            elapsed: rendered.elapsed.elapsed().as_micros() as f32 / 1000.0,
+            path: rendered.path,
+            store: rendered.store,
+            title: rendered.title,
+            elapsed,
         }
     }
 }
@@ -100,13 +95,19 @@ impl PageRenderResponseJson {
 #[derive(ApiResponse)]
 pub enum PageRenderResponse {
     #[oai(status = 200, content_type = "application/json; charset=utf-8")]
-    Json(Json<PageRenderResponseJson>),
+    Json(
+        Json<PageRenderResponseJson>,
+        #[oai(header = "ETag")] Option<String>,
+    ),
     #[oai(status = 200, content_type = "text/html; charset=utf-8")]
-    Html(PlainText<String>),
+    Html(PlainText<String>, #[oai(header = "ETag")] Option<String>),
     #[oai(status = 200, content_type = "text/css; charset=utf-8")]
-    Css(PlainText<String>),
+    Css(PlainText<String>, #[oai(header = "ETag")] Option<String>),
     #[oai(status = 200, content_type = "application/pdf")]
-    Pdf(Binary<Vec<u8>>),
+    Pdf(Binary<Vec<u8>>, #[oai(header = "ETag")] Option<String>),
+    /// The page did not change since the ETag the client sent in If-None-Match
+    #[oai(status = 304)]
+    NotModified(#[oai(header = "ETag")] String),
     #[oai(status = 500, content_type = "application/json; charset=utf-8")]
     Error(Json<Details>),
 }
@@ -4,15 +4,84 @@
 // A commercial license on request is also available;
 // contact info@coralbits.com for details.
 
-use std::collections::HashMap;
+use std::collections::{HashMap, HashSet};
 
 use crate::cache::cache;
 use async_trait::async_trait;
 use minijinja::{context, Value};
+use once_cell::sync::Lazy;
+use tokio::task::JoinSet;
 use tracing::debug;
 
 use crate::{traits::Store, Element, Widget, WidgetEditor, WidgetResults};
 
+/// Template of the widgets that only output their children, as is
+pub const CHILDREN_TEMPLATE: &str = "{% for child in context.children %}{{child}}{% endfor %}";
+
+/// Idle connections kept per host by the url_context client
+const HTTP_POOL_IDLE_PER_HOST: usize = 32;
+
+/// Most url_context URLs fetched at once when prefetching a page, so big pages
+/// don't flood the services behind them
+pub(super) const URL_PREFETCH_CONCURRENCY: usize = 16;
+
+/// Shared by all url_context fetches, so connections (and TLS sessions) are
+/// kept alive and reused between elements and requests.
+static HTTP_CLIENT: Lazy<reqwest::Client> = Lazy::new(|| {
+    reqwest::Client::builder()
+        .pool_max_idle_per_host(HTTP_POOL_IDLE_PER_HOST)
+        .build()
+        .unwrap_or_default()
+});
+
+/// Widgets implemented in code. They never change, so they are built once on first use.
+static CODE_WIDGETS: Lazy<Vec<Widget>> = Lazy::new(|| {
+    vec![
+        Widget {
+            name: "static_context".to_string(),
+            description: "Static context".to_string(),
+            html: CHILDREN_TEMPLATE.to_string(),
+            icon: "networkWired".to_string(),
+            css: "".to_string(),
+            editor: vec![
+                WidgetEditor::new()
+                    .with_editor_type("description".to_string())
+                    .with_label("Description".to_string())
+                    .with_placeholder("This variable will be added to the context for the children of this widget, and can be accessed in the template code".to_string()),
+                WidgetEditor::new()
+                    .with_editor_type("text".to_string())
+                    .with_label("Variable name".to_string())
+                    .with_name("key".to_string())
+                    .with_placeholder("Enter variable name".to_string()),
+                WidgetEditor::new()
+                    .with_editor_type("textarea".to_string())
+                    .with_label("Static JSON value".to_string())
+                    .with_name("value".to_string())
+                    .with_placeholder("Enter static JSON code".to_string()),
+            ],
+        },
+        Widget {
+            name: "url_context".to_string(),
+            description: "URL context".to_string(),
+            html: CHILDREN_TEMPLATE.to_string(),
+            icon: "gem".to_string(),
+            css: "".to_string(),
+            editor: vec![
+                WidgetEditor::new()
+                    .with_editor_type("text".to_string())
+                    .with_label("Variable name".to_string())
+                    .with_name("key".to_string())
+                    .with_placeholder("Enter variable name".to_string()),
+                WidgetEditor::new()
+                    .with_editor_type("text".to_string())
+                    .with_label("URL".to_string())
+                    .with_name("url".to_string())
+                    .with_placeholder("Enter URL".to_string()),
+            ],
+        },
+    ]
+});
+
 pub struct CodeStore {
     name: String,
 }
@@ -24,14 +93,22 @@ impl CodeStore {
         }
     }
 
+    /// Whether the widget adds values to the context of its children, see `get_nested_widget_context`
+    pub fn is_context_widget(name: &str) -> bool {
+        matches!(name, "static_context" | "url_context")
+    }
+
+    /// `failed_urls` are the URLs that could not be fetched for this render
+    /// already, as returned by `prefetch_url_contexts`, with their errors.
     pub async fn get_nested_widget_context(
         element: &Element,
         ctx: &minijinja::Value,
+        failed_urls: &HashMap<String, String>,
     ) -> anyhow::Result<minijinja::Value> {
         debug!("Getting nested widget context: widget={}", element.widget);
         match element.widget.split("/").nth(1).unwrap_or("??") {
             "static_context" => CodeStore::static_context(element, ctx).await,
-            "url_context" => CodeStore::url_context(element, ctx).await,
+            "url_context" => CodeStore::url_context(element, ctx, failed_urls).await,
             name => Err(anyhow::anyhow!("Widget not found: {}", name)),
         }
     }
@@ -61,14 +138,100 @@ impl CodeStore {
         Ok(ctx)
     }
 
+    /// Gets the url contents, and stores them in the cache
+    async fn fetch_url(url: &str) -> anyhow::Result<String> {
+        // ask for application/json
+        let url_contents = HTTP_CLIENT
+            .get(url)
+            .header(reqwest::header::CONTENT_TYPE, "application/json")
+            .header(reqwest::header::USER_AGENT, "coralpages")
+            .send()
+            .await?;
+        let body = String::from_utf8(url_contents.bytes().await?.to_vec())?;
+        debug!("Body length: {:?}", body.len());
+        cache::cache().set(url, &body).await;
+        Ok(body)
+    }
+
+    /// Fetches at once the URLs of all the url_context elements in the tree, so
+    /// their latencies overlap instead of adding up while rendering. Rendering
+    /// then finds them in the cache. Returns the URLs that failed, with their
+    /// errors, for the render to report without trying them again.
+    pub async fn prefetch_url_contexts(elements: &[Element]) -> HashMap<String, String> {
+        let mut urls = HashSet::new();
+        let mut stack: Vec<&Element> = elements.iter().collect();
+        while let Some(element) = stack.pop() {
+            if Self::is_url_context(element) {
+                if let Some(url) = element.data.get("url") {
+                    urls.insert(url.clone());
+                }
+            }
+            stack.extend(element.children.iter());
+        }
+        let mut failed_urls = HashMap::new();
+        // a single one gains nothing from running apart
+        if urls.len() < 2 {
+            return failed_urls;
+        }
+
+        let mut fetches = JoinSet::new();
+        for url in urls {
+            if fetches.len() >= URL_PREFETCH_CONCURRENCY {
+                if let Some(Ok(Some((url, error)))) = fetches.join_next().await {
+                    failed_urls.insert(url, error);
+                }
+            }
+            fetches.spawn(async move {
+                if cache::cache().get(&url).await.is_some() {
+                    return None;
+                }
+                match Self::fetch_url(&url).await {
+                    Ok(_) => None,
+                    Err(e) => {
+                        debug!("Could not prefetch URL: {}: {}", url, e);
+                        Some((url, e.to_string()))
+                    }
+                }
+            });
+        }
+        while let Some(fetched) = fetches.join_next().await {
+            if let Ok(Some((url, error))) = fetched {
+                failed_urls.insert(url, error);
+            }
+        }
+        failed_urls
+    }
+
+    /// Whether any element of the tree is a url_context, so what the page
+    /// renders to depends on what its URLs return at the time
+    pub fn uses_url_context(elements: &[Element]) -> bool {
+        let mut stack: Vec<&Element> = elements.iter().collect();
+        while let Some(element) = stack.pop() {
+            if Self::is_url_context(element) {
+                return true;
+            }
+            stack.extend(element.children.iter());
+        }
+        false
+    }
+
+    fn is_url_context(element: &Element) -> bool {
+        element.widget.split('/').nth(1) == Some("url_context")
+    }
+
     async fn url_context(
         element: &Element,
         ctx: &minijinja::Value,
+        failed_urls: &HashMap<String, String>,
     ) -> anyhow::Result<minijinja::Value> {
         let url = element
             .data
             .get("url")
             .ok_or_else(|| anyhow::anyhow!("URL not found"))?;
+        // failed already for this render, trying again would only wait as long again
+        if let Some(error) = failed_urls.get(url) {
+            return Err(anyhow::anyhow!("Could not fetch URL: {}: {}", url, error));
+        }
         let key = element
             .data
             .get("key")
@@ -88,21 +251,8 @@ impl CodeStore {
         let value = match value {
             Some(value) => value,
             None => {
-                // get the url contents, ask for application/json
-                let client = reqwest::Client::new();
-                let url_contents = client
-                    .get(url)
-                    .header(reqwest::header::CONTENT_TYPE, "application/json")
-                    .header(reqwest::header::USER_AGENT, "coralpages")
-                    .send()
-                    .await?;
-                let body = url_contents.bytes().await?;
-                cache::cache()
-                    .set(url, &String::from_utf8(body.to_vec())?)
-                    .await;
-                debug!("Body length: {:?}", body.len());
-                let body: Value = serde_json::from_slice(&body)?;
-                body
+                let body = Self::fetch_url(url).await?;
+                serde_json::from_str(&body)?
             }
         };
 
@@ -130,73 +280,13 @@ impl Store for CodeStore {
     }
 
     async fn load_widget_definition(&self, path: &str) -> anyhow::Result<Option<Widget>> {
-        match path {
-    "static_context" => {
-        Ok(Some(Widget {
-            name: "static_context".to_string(),
-            description: "Static context".to_string(),
-            html: "{% for child in context.children %}{{child}}{% endfor %}".to_string(),
-            icon: "networkWired".to_string(),
-            css: "".to_string(),
-            editor: vec![
-                WidgetEditor::new()
-                .with_editor_type("description".to_string())
-                .with_label("Description".to_string())
-                .with_placeholder("This variable will be added to the context for the children of this widget, and can be accessed in the template code".to_string())
-                ,
-                WidgetEditor::new()
-                .with_editor_type("text".to_string())
-                .with_label("Variable name".to_string())
-                .with_name("key".to_string())
-                .with_placeholder("Enter variable name".to_string()) 
-                ,
-                WidgetEditor::new()
-                .with_editor_type("textarea".to_string())
-                .with_label("Static JSON value".to_string())
-                .with_name("value".to_string())
-                .with_placeholder("Enter static JSON code".to_string()) 
-                ,
-            ],
-        }))
-    }
-    "url_context" => {
-        Ok(Some(Widget {
-            name: "url_context".to_string(),
-            description: "URL context".to_string(),
-            html: "{% for child in context.children %}{{child}}{% endfor %}".to_string(),
-            icon: "gem".to_string(),
-            css: "".to_string(),
-            editor: vec![
-                WidgetEditor::new()
-                .with_editor_type("text".to_string())
-                .with_label("Variable name".to_string())
-                .with_name("key".to_string())
-                .with_placeholder("Enter variable name".to_string()) 
-                ,
-                WidgetEditor::new()
-                .with_editor_type("text".to_string())
-                .with_label("URL".to_string())
-                .with_name("url".to_string())
-                .with_placeholder("Enter URL".to_string())
-                ,
-            ],
-        }))
-    },
-    _ => {
-        Ok(None)
-    }
-        }
+        Ok(CODE_WIDGETS.iter().find(|w| w.name == path).cloned())
     }
 
     async fn get_widget_list(&self) -> anyhow::Result<WidgetResults> {
         Ok(WidgetResults {
-            count: 1,
-            results: vec![
-                self.load_widget_definition("static_context")
-                    .await?
-                    .unwrap(),
-                self.load_widget_definition("url_context").await?.unwrap(),
-            ],
+            count: CODE_WIDGETS.len(),
+            results: CODE_WIDGETS.clone(),
         })
     }
 }
@@ -4,35 +4,63 @@
 // A commercial license on request is also available;
 // contact info@coralbits.com for details.
 
-use std::collections::HashMap;
+use std::{
+    collections::HashMap,
+    str::FromStr,
+    sync::Mutex,
+    time::{Duration, Instant},
+};
 
 use anyhow::Result;
 use async_trait::async_trait;
-use sqlx::{sqlite::SqlitePool, Executor, Row};
+use serde::Deserialize;
+use sqlx::{
+    sqlite::{SqliteConnectOptions, SqliteJournalMode, SqlitePool, SqliteSynchronous},
+    Executor, Row,
+};
 use tracing::{debug, error, info};
 
-use crate::{page::types::Page, store::traits::Store, PageInfo, ResultPageList};
+use crate::{
+    cache::lru::LruCache, page::types::Page, store::traits::Store, PageInfo, ResultPageList,
+};
+
+/// Maximum number of parsed pages kept by each database store
+const PAGE_CACHE_SIZE: usize = 256;
+/// How long a parsed page is used before reading it again, as other processes
+/// may change the database too
+pub(super) const PAGE_CACHE_TTL: Duration = Duration::from_secs(30);
+
+/// Only the part of a stored page needed to list it. The rest of the JSON is
+/// skipped by the parser instead of building the whole element tree.
+#[derive(Deserialize)]
+struct PageTitle {
+    #[serde(default)]
+    title: String,
+}
 
 pub struct DbStore {
     name: String,
     db: SqlitePool,
+    // parsed pages, and when they were read
+    pub(super) pages: Mutex<LruCache<String, (Instant, Page)>>,
 }
 
 impl DbStore {
     pub async fn new(name: &str, url: &str) -> Result<Self> {
         info!("Connecting to database at url={}", url);
-        // Create database file if it doesn't exist
-        if url.starts_with("sqlite://") {
-            let path = url.trim_start_matches("sqlite://");
-            if !std::path::Path::new(path).exists() {
-                debug!("Creating new SQLite database file at {}", path);
-                std::fs::File::create(path)?;
-            }
-        }
-        let db = SqlitePool::connect(url).await?;
+        // Let SQLite create the database file if it doesn't exist, instead of probing it first.
+        // WAL lets page reads go on while a page is saved, and with it NORMAL sync is still
+        // safe, and skips a sync per save. Queries are prepared once per connection, by sqlx.
+        let options = SqliteConnectOptions::from_str(url)?
+            .create_if_missing(true)
+            .journal_mode(SqliteJournalMode::Wal)
+            .synchronous(SqliteSynchronous::Normal)
+            .pragma("temp_store", "memory");
+        let db = SqlitePool::connect_with(options).await?;
         let ret = Self {
             name: name.to_string(),
             db,
+            pages: Mutex::new(LruCache::new(PAGE_CACHE_SIZE)),
         };
 
         ret.init().await?;
@@ -60,6 +88,21 @@ impl Store for DbStore {
     }
 
     async fn load_page_definition(&self, path: &str) -> anyhow::Result<Option<Page>> {
+        {
+            let mut pages = self.pages.lock().unwrap();
+            // checked before using it, so an expired page is not made the newest just to go
+            let fresh = pages
+                .peek(path)
+                .map(|(read, _)| read.elapsed() < PAGE_CACHE_TTL);
+            match fresh {
+                Some(true) => return Ok(pages.get(path).map(|(_, page)| page.clone())),
+                Some(false) => {
+                    pages.remove(path);
+                }
+                None => {}
+            }
+        }
+
         let rec = sqlx::query(r#"SELECT data FROM pages WHERE path = ?"#)
             .bind(path)
             .fetch_one(&self.db)
@@ -67,7 +110,13 @@ impl Store for DbStore {
 
         match rec {
             Ok(rec) => {
-                let page: Page = serde_json::from_str(&rec.get::<String, _>("data"))?;
+                // parse straight from the row, without copying the JSON out first
+                let page = serde_json::from_str::<Page>(rec.try_get::<&str, _>("data")?)?
+                    .with_definition_hash();
+                self.pages
+                    .lock()
+                    .unwrap()
+                    .insert(path.to_string(), (Instant::now(), page.clone()));
                 Ok(Some(page))
             }
             Err(e) => {
@@ -78,12 +127,15 @@ impl Store for DbStore {
     }
 
     async fn save_page_definition(&self, path: &str, page: &Page) -> anyhow::Result<()> {
+        self.pages.lock().unwrap().remove(path);
         let data = serde_json::to_string(page)?;
         sqlx::query(r#"INSERT OR REPLACE INTO pages (path, data) VALUES (?, ?)"#)
             .bind(path)
             .bind(data)
             .execute(&self.db)
             .await?;
+        // and again, a load while saving may have cached the old one
+        self.pages.lock().unwrap().remove(path);
         Ok(())
     }
 
@@ -94,17 +146,20 @@ impl Store for DbStore {
         _filter: &HashMap<String, String>,
     ) -> anyhow::Result<ResultPageList> {
         debug!("get_page_list offset={}, limit={}", _offset, _limit);
-        let recs = sqlx::query(r#"SELECT path, data FROM pages LIMIT ? OFFSET ?"#)
-            .bind(_limit as i64)
-            .bind(_offset as i64)
-            .fetch_all(&self.db)
-            .await?;
+        // the total comes in every row of the window, so it is a single query
+        let recs = sqlx::query(
+            r#"SELECT path, data, COUNT(*) OVER () AS total FROM pages LIMIT ? OFFSET ?"#,
+        )
+        .bind(_limit as i64)
+        .bind(_offset as i64)
+        .fetch_all(&self.db)
+        .await?;
 
         let pages = recs
             .iter()
             .map(|row| {
-                let page_def = row.get::<String, _>("data");
-                let page: Page = match serde_json::from_str(&page_def) {
+                let page_def = row.get::<&str, _>("data");
+                let page: PageTitle = match serde_json::from_str(page_def) {
                     Ok(page) => page,
                     Err(e) => {
                         error!(
@@ -117,17 +172,23 @@ impl Store for DbStore {
                 };
                 Some(PageInfo {
                     id: row.get::<String, _>("path"),
-                    title: page.title.clone(),
+                    title: page.title,
                     url: "".to_string(),
                     store: "".to_string(),
                 })
             })
             .collect::<Vec<Option<PageInfo>>>();
 
-        let count = sqlx::query("SELECT COUNT(*) FROM pages")
-            .fetch_one(&self.db)
-            .await?
-            .get::<i64, _>(0);
+        let count = match recs.first() {
+            Some(row) => row.get::<i64, _>("total"),
+            // a full window from the start came back empty, so there are no pages
+            None if _offset == 0 && _limit > 0 => 0,
+            // past the end, the total has to be asked apart
+            None => sqlx::query("SELECT COUNT(*) FROM pages")
+                .fetch_one(&self.db)
+                .await?
+                .get::<i64, _>(0),
+        };
 
         // remove None from pages
         let pages = pages
@@ -17,22 +17,25 @@ use crate::{
 };
 
 pub struct StoreFactory {
-    // could be a hashmap, but order is important.
-    // There should not be be ever too many stores to make this slower than a hash
+    // a vec, as order is important
     stores: Vec<Box<dyn Store>>,
+    // position in stores by name, as every widget, class and page lookup goes through it
+    by_name: HashMap<String, usize>,
 }
 
 impl StoreFactory {
     pub fn new() -> Self {
-        Self { stores: Vec::new() }
+        Self {
+            stores: Vec::new(),
+            by_name: HashMap::new(),
+        }
     }
 
     pub fn get_store(&self, name: &str) -> Option<&dyn Store> {
         let store = self
-            .stores
-            .iter()
-            .find(|s| s.name() == name)
-            .map(|s| s.as_ref());
+            .by_name
+            .get(name)
+            .map(|&index| self.stores[index].as_ref());
         if store.is_none() {
             error!("Store not found name={}", name);
         }
@@ -41,18 +44,21 @@ impl StoreFactory {
 
     pub fn add_store(&mut self, store: Box<dyn Store>) {
         info!("Added store: {}", store.name());
+        // on repeated names the first store wins, as with a linear search
+        self.by_name
+            .entry(store.name().to_string())
+            .or_insert(self.stores.len());
         self.stores.push(store);
     }
 
-    fn split_path(&self, path: &str) -> Result<(String, String), anyhow::Error> {
-        let parts: Vec<&str> = path.splitn(2, '/').collect();
-        if parts.len() < 2 {
-            return Err(StoreError::InvalidPath {
+    /// Splits "store/subpath", borrowing both parts from `path`.
+    fn split_path<'p>(&self, path: &'p str) -> Result<(&'p str, &'p str), anyhow::Error> {
+        path.split_once('/').ok_or_else(|| {
+            StoreError::InvalidPath {
                 path: path.to_string(),
             }
-            .into());
-        }
-        Ok((parts[0].to_string(), parts[1].to_string()))
+            .into()
+        })
     }
 
     pub async fn new_store(store_config: &StoreConfig) -> Result<Box<dyn Store>> {
@@ -84,11 +90,14 @@ impl Store for StoreFactory {
     async fn load_widget_definition(&self, path: &str) -> anyhow::Result<Option<Widget>> {
         // info!("Loading widget definition, path={}", path);
         let (store_name, subpath) = self.split_path(path)?;
-        let store = self.get_store(&store_name);
+        let store = self.get_store(store_name);
         if let Some(store) = store {
-            store.load_widget_definition(&subpath).await
+            store.load_widget_definition(subpath).await
         } else {
-            Err(StoreError::StoreNotFound { store: store_name }.into())
+            Err(StoreError::StoreNotFound {
+                store: store_name.to_string(),
+            }
+            .into())
         }
     }
 
@@ -99,7 +108,7 @@ impl Store for StoreFactory {
         for store in stores {
             let store = self.get_store(store);
             if let Some(store) = store {
-                let page = store.load_page_definition(&subpath).await?;
+                let page = store.load_page_definition(subpath).await?;
                 if let Some(mut page) = page {
                     page.store = store.name().to_string();
                     page.path = subpath.to_string();
@@ -115,21 +124,27 @@ impl Store for StoreFactory {
 
     async fn save_page_definition(&self, path: &str, page: &Page) -> anyhow::Result<()> {
         let (store_name, subpath) = self.split_path(path)?;
-        let store = self.get_store(&store_name);
+        let store = self.get_store(store_name);
         if let Some(store) = store {
-            store.save_page_definition(&subpath, page).await
+            store.save_page_definition(subpath, page).await
         } else {
-            Err(StoreError::StoreNotFound { store: store_name }.into())
+            Err(StoreError::StoreNotFound {
+                store: store_name.to_string(),
+            }
+            .into())
         }
     }
 
     async fn delete_page_definition(&self, path: &str) -> anyhow::Result<bool> {
         let (store_name, subpath) = self.split_path(path)?;
-        let store = self.get_store(&store_name);
+        let store = self.get_store(store_name);
         if let Some(store) = store {
-            store.delete_page_definition(&subpath).await
+            store.delete_page_definition(subpath).await
         } else {
-            Err(StoreError::StoreNotFound { store: store_name }.into())
+            Err(StoreError::StoreNotFound {
+                store: store_name.to_string(),
+            }
+            .into())
         }
     }
 
@@ -211,11 +226,14 @@ impl Store for StoreFactory {
 
     async fn load_css_class_definition(&self, name: &str) -> anyhow::Result<Option<CssClass>> {
         let (store_name, subpath) = self.split_path(name)?;
-        let store = self.get_store(&store_name);
+        let store = self.get_store(store_name);
         if let Some(store) = store {
-            store.load_css_class_definition(&subpath).await
+            store.load_css_class_definition(subpath).await
         } else {
-            Err(StoreError::StoreNotFound { store: store_name }.into())
+            Err(StoreError::StoreNotFound {
+                store: store_name.to_string(),
+            }
+            .into())
         }
     }
 }
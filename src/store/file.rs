@@ -7,19 +7,33 @@
 use std::{
     collections::HashMap,
     fs::{self, File},
+    io::{ErrorKind, Read},
     path::{Path, PathBuf},
+    sync::{Arc, Mutex},
+    time::{Duration, Instant, SystemTime},
 };
 
 use async_trait::async_trait;
 use serde::Deserialize;
-use tracing::{error, info};
+use tokio::task::JoinSet;
+use tracing::{debug, error, info};
 
 use crate::{
+    cache::lru::LruCache,
     page::types::{Page, PageInfo, ResultPageList, Widget},
     store::traits::Store,
     CssClass, CssClassResult, CssClassResults, StoreConfig, WidgetResults,
 };
 
+/// Maximum number of page lookups remembered by each file store
+const LOOKUP_CACHE_SIZE: usize = 1024;
+/// Maximum number of parsed pages kept by each file store
+const PAGE_CACHE_SIZE: usize = 256;
+/// How long a missing page is remembered before asking the filesystem again
+pub(super) const MISSING_PAGE_TTL: Duration = Duration::from_secs(5);
+/// Maximum number of page files read at the same time for a page list
+const PAGE_READ_CONCURRENCY: usize = 16;
+
 #[derive(Debug, Deserialize)]
 struct CssClasses {
     css_classes: Vec<CssClass>,
@@ -39,6 +53,17 @@ pub struct FileStore {
     has_widgets: bool,
     has_css_classes: bool,
     has_pages: bool,
+    // shared with the blocking tasks that read the page list
+    files: Arc<PageFiles>,
+}
+
+/// The page files of a store, and what is known about them
+struct PageFiles {
+    path: PathBuf,
+    // page ids that were not found, and when
+    missing_pages: Mutex<LruCache<String, Instant>>,
+    // parsed pages, with the modification time and size of the file they were read from
+    pages: Mutex<LruCache<String, (SystemTime, u64, Page)>>,
 }
 
 impl FileStore {
@@ -51,6 +76,11 @@ impl FileStore {
             has_widgets: config.tags.contains(&"widgets".to_string()),
             has_css_classes: config.tags.contains(&"css_classes".to_string()),
             has_pages: config.tags.contains(&"pages".to_string()),
+            files: Arc::new(PageFiles {
+                path: Path::new(&config.path).to_path_buf(),
+                missing_pages: Mutex::new(LruCache::new(LOOKUP_CACHE_SIZE)),
+                pages: Mutex::new(LruCache::new(PAGE_CACHE_SIZE)),
+            }),
         };
 
         if ret.has_widgets {
@@ -77,22 +107,25 @@ impl FileStore {
         let mut css_classes: HashMap<String, CssClass> = HashMap::new();
         for entry in fs::read_dir(path)? {
             let entry = entry?;
+            if !entry.file_type()?.is_file()
+                || !entry.file_name().to_string_lossy().ends_with(".yaml")
+            {
+                continue;
+            }
             let path = entry.path();
-            if path.is_file() && path.extension().unwrap_or_default() == "yaml" {
-                let css_class = match self.load_css_class_config(&path) {
-                    Ok(css_class) => css_class,
-                    Err(e) => {
-                        error!(
-                            "Error loading CSS class from path={}: {}",
-                            path.display(),
-                            e
-                        );
-                        continue;
-                    }
-                };
-                for css_class in css_class.css_classes {
-                    css_classes.insert(css_class.name.clone(), css_class);
+            let css_class = match self.load_css_class_config(&path) {
+                Ok(css_class) => css_class,
+                Err(e) => {
+                    error!(
+                        "Error loading CSS class from path={}: {}",
+                        path.display(),
+                        e
+                    );
+                    continue;
                 }
+            };
+            for css_class in css_class.css_classes {
+                css_classes.insert(css_class.name.clone(), css_class);
             }
         }
         info!(
@@ -107,21 +140,25 @@ impl FileStore {
     }
 
     fn load_css_class_config(&mut self, path: &Path) -> anyhow::Result<CssClasses> {
-        let file = File::open(path)?;
-        let css_class: CssClasses = serde_yaml::from_reader(file)?;
+        let data = fs::read(path)?;
+        let css_class: CssClasses = serde_yaml::from_slice(&data)?;
         Ok(css_class)
     }
 
     fn load_widgets(&mut self, config_path: &Path) -> anyhow::Result<()> {
-        if !config_path.exists() {
-            info!(
-                "Widgets config not found, path={}, no widgets loaded",
-                config_path.display()
-            );
-            return Ok(());
-        }
+        let data = match fs::read(config_path) {
+            Ok(data) => data,
+            Err(e) if e.kind() == ErrorKind::NotFound => {
+                info!(
+                    "Widgets config not found, path={}, no widgets loaded",
+                    config_path.display()
+                );
+                return Ok(());
+            }
+            Err(e) => return Err(e.into()),
+        };
 
-        let config = self.load_widget_config(config_path)?;
+        let config = self.load_widget_config(&data)?;
 
         let widgets: HashMap<String, Widget> = config
             .widgets
@@ -135,9 +172,8 @@ impl FileStore {
         Ok(())
     }
 
-    fn load_widget_config(&mut self, path: &Path) -> anyhow::Result<FileStoreConfig> {
-        let file = File::open(path)?;
-        let mut config: FileStoreConfig = serde_yaml::from_reader(file)?;
+    fn load_widget_config(&mut self, data: &[u8]) -> anyhow::Result<FileStoreConfig> {
+        let mut config: FileStoreConfig = serde_yaml::from_slice(data)?;
 
         // Load all widgets HTML and CSS
         for widget in config.widgets.iter_mut() {
@@ -179,6 +215,96 @@ impl FileStore {
     }
 }
 
+impl PageFiles {
+    /// Whether `path` was recently looked up and not found. Avoids hitting the
+    /// filesystem again for repeated misses, as when a store is a fallback.
+    fn is_known_missing(&self, path: &str) -> bool {
+        let mut missing_pages = self.missing_pages.lock().unwrap();
+        match missing_pages.get(path) {
+            Some(since) if since.elapsed() < MISSING_PAGE_TTL => true,
+            Some(_) => {
+                missing_pages.remove(path);
+                false
+            }
+            None => false,
+        }
+    }
+
+    /// Drops what the caches know about the page at `path`
+    fn forget_page(&self, path: &str) {
+        self.missing_pages.lock().unwrap().remove(path);
+        self.pages.lock().unwrap().remove(path);
+    }
+
+    /// Reads the page at `path`, through the missing and parsed page caches.
+    fn read_page(&self, path: &str) -> anyhow::Result<Option<Page>> {
+        if self.is_known_missing(path) {
+            debug!("Page definition known to be missing, path={}", path);
+            return Ok(None);
+        }
+        let page_id = path;
+        let path = self.page_file_path(path);
+        // info!("Loading page definition from {}", path.display());
+        let (modified, size) = match fs::metadata(&path) {
+            Ok(metadata) => (metadata.modified()?, metadata.len()),
+            Err(e) if e.kind() == ErrorKind::NotFound => {
+                // expected when stores are tried in order, not worth an error
+                debug!("Page definition not found, path={}", path.display());
+                self.missing_pages
+                    .lock()
+                    .unwrap()
+                    .insert(page_id.to_string(), Instant::now());
+                return Ok(None);
+            }
+            Err(e) => {
+                error!(
+                    "Error loading page definition from path={}: {}",
+                    path.display(),
+                    e
+                );
+                return Ok(None);
+            }
+        };
+        // unchanged since last parsed, skip the YAML parsing. The size catches
+        // rewrites within the mtime granularity of coarse filesystems.
+        if let Some((cached_modified, cached_size, page)) = self.pages.lock().unwrap().get(page_id)
+        {
+            if *cached_modified == modified && *cached_size == size {
+                return Ok(Some(page.clone()));
+            }
+        }
+        let mut file = match File::open(&path) {
+            Ok(file) => file,
+            Err(e) => {
+                error!(
+                    "Error loading page definition from path={}: {}",
+                    path.display(),
+                    e
+                );
+                return Ok(None);
+            }
+        };
+        // read it all at once, sized from the metadata we already have, and parse from memory
+        let mut data = Vec::with_capacity(size as usize);
+        file.read_to_end(&mut data)?;
+        // hashed once per file version, so ETags don't serialize the page on every request
+        let page = serde_yaml::from_slice::<Page>(&data)?.with_definition_hash();
+        self.pages
+            .lock()
+            .unwrap()
+            .insert(page_id.to_string(), (modified, size, page.clone()));
+        Ok(Some(page))
+    }
+
+    /// Path of the YAML file that backs the page at `path`.
+    fn page_file_path(&self, path: &str) -> PathBuf {
+        let mut filename = String::with_capacity(path.len() + 5);
+        filename.push_str(path);
+        filename.push_str(".yaml");
+        self.path.join(filename)
+    }
+}
+
 #[async_trait]
 impl Store for FileStore {
     fn name(&self) -> &str {
@@ -194,45 +320,25 @@ impl Store for FileStore {
         //     path,
         //     self.widgets.len()
         // );
-        let widget = self.widgets.get(path).map(|w| Widget {
-            name: w.name.clone(),
-            html: w.html.clone(),
-            css: w.css.clone(),
-            editor: w.editor.clone(),
-            description: w.description.clone(),
-            icon: w.icon.clone(),
-        });
-        Ok(widget)
+        Ok(self.widgets.get(path).cloned())
     }
 
     async fn load_page_definition(&self, path: &str) -> anyhow::Result<Option<Page>> {
         if !self.has_pages {
             return Ok(None);
         }
-        let path = Path::new(&self.path).join(format!("{}.yaml", path));
-        // info!("Loading page definition from {}", path.display());
-        let file = match File::open(&path) {
-            Ok(file) => file,
-            Err(e) => {
-                error!(
-                    "Error loading page definition from path={}: {}",
-                    path.display(),
-                    e
-                );
-                return Ok(None);
-            }
-        };
-        let page: Page = serde_yaml::from_reader(file)?;
-        Ok(Some(page))
+        self.files.read_page(path)
     }
 
     async fn save_page_definition(&self, path: &str, page: &Page) -> anyhow::Result<()> {
         if !self.has_pages {
             return Ok(());
         }
-        let path = Path::new(&self.path).join(format!("{}.yaml", path));
-        let file = File::create(path)?;
+        self.files.forget_page(path);
+        let file = File::create(self.files.page_file_path(path))?;
         serde_yaml::to_writer(file, page)?;
+        // and again, a read while writing may have cached it as missing, or half written
+        self.files.forget_page(path);
         Ok(())
     }
 
@@ -240,12 +346,12 @@ impl Store for FileStore {
         if !self.has_pages {
             return Ok(false);
         }
-        let path = Path::new(&self.path).join(format!("{}.yaml", path));
-        if path.exists() {
-            std::fs::remove_file(path)?;
-            Ok(true)
-        } else {
-            Ok(false)
+        self.files.pages.lock().unwrap().remove(path);
+        let path = self.files.page_file_path(path);
+        match fs::remove_file(path) {
+            Ok(()) => Ok(true),
+            Err(e) if e.kind() == ErrorKind::NotFound => Ok(false),
+            Err(e) => Err(e.into()),
         }
     }
 
@@ -279,46 +385,83 @@ impl Store for FileStore {
 
         let entries = entries.unwrap();
 
+        // Only names are needed to filter and count, so pages are parsed just for the requested window
+        let mut page_ids: Vec<String> = Vec::new();
         for entry in entries {
             let entry = entry?;
-            let path = entry.path();
-            if path.is_file() && path.extension().unwrap_or_default() == "yaml" {
-                // page path wihtout the .yaml extension, and the self.path prefix, and prefix /
-                let path_str = path.to_str().unwrap();
-                let page_id =
-                    path_str[self.path.to_str().unwrap().len()..path_str.len() - 5].to_string();
-
-                if let Some(filter_type) = filter_type {
-                    if filter_type == "template" && !path_str.starts_with("_") {
-                        continue; // skip non templates
-                    }
-                    if filter_type == "page" && path_str.starts_with("_") {
-                        continue; // skip non pages
-                    }
+            // page id is the file name without the .yaml extension
+            let file_name = entry.file_name();
+            let Some(page_id) = file_name
+                .to_str()
+                .and_then(|name| name.strip_suffix(".yaml"))
+            else {
+                continue;
+            };
+            // file_type() comes from the directory listing itself, no extra stat
+            if !entry.file_type()?.is_file() {
+                continue;
+            }
+            if let Some(filter_type) = filter_type {
+                if filter_type == "template" && !page_id.starts_with('_') {
+                    continue; // skip non templates
                 }
-
-                // info!("Loading page definition from path={}", page_id);
-                let page = match self.load_page_definition(&page_id).await {
-                    Ok(page) => page,
-                    Err(e) => {
-                        error!("Error loading page definition from path={}: {}", page_id, e);
-                        continue;
-                    }
-                };
-                if let Some(page) = page {
-                    let pageinfo: PageInfo = PageInfo {
-                        id: page_id,
-                        store: "".to_string(),
-                        title: page.title.clone(),
-                        url: format!("/{}", page.path).to_string(),
-                    };
-                    pages.push(pageinfo);
+                if filter_type == "page" && page_id.starts_with('_') {
+                    continue; // skip non pages
                 }
             }
+            page_ids.push(page_id.to_string());
+        }
+        // directory order is arbitrary, sort so pagination is stable
+        page_ids.sort_unstable();
+
+        // The count is of page files, not of pages that parse, so windows are the same on every
+        // call without parsing all of them. A page that does not parse is left out of its
+        // window, and logged, but still counted.
+        let count = page_ids.len();
+
+        // Cold pages are a read and a YAML parse each, so they are read on the blocking pool,
+        // a few at a time, and put back in order after.
+        let mut reads = JoinSet::new();
+        let mut read_pages = Vec::new();
+        for (index, page_id) in page_ids.into_iter().skip(offset).take(limit).enumerate() {
+            if reads.len() >= PAGE_READ_CONCURRENCY {
+                if let Some(Ok(read)) = reads.join_next().await {
+                    read_pages.push(read);
+                }
+            }
+            let files = self.files.clone();
+            reads.spawn_blocking(move || {
+                let page = files.read_page(&page_id);
+                (index, page_id, page)
+            });
+        }
+        while let Some(read) = reads.join_next().await {
+            if let Ok(read) = read {
+                read_pages.push(read);
+            }
+        }
+        read_pages.sort_unstable_by_key(|(index, _, _)| *index);
+
+        for (_, page_id, page) in read_pages {
+            // info!("Loading page definition from path={}", page_id);
+            let page = match page {
+                Ok(page) => page,
+                Err(e) => {
+                    error!("Error loading page definition from path={}: {}", page_id, e);
+                    continue;
+                }
+            };
+            if let Some(page) = page {
+                let pageinfo: PageInfo = PageInfo {
+                    id: page_id,
+                    store: "".to_string(),
+                    title: page.title,
+                    url: format!("/{}", page.path),
+                };
+                pages.push(pageinfo);
+            }
         }
 
-        let count = pages.len();
-        let pages = pages.into_iter().skip(offset).take(limit).collect();
         Ok(ResultPageList {
             count,
             results: pages,
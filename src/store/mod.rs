@@ -9,3 +9,6 @@ pub mod db;
 pub mod factory;
 pub mod file;
 pub mod traits;
+
+#[cfg(test)]
+mod tests;
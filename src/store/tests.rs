@@ -0,0 +1,357 @@
+// (C) Coralbits SL 2025
+// This file is part of Coralpages and is licensed under the
+// GNU Affero General Public License v3.0.
+// A commercial license on request is also available;
+// contact info@coralbits.com for details.
+
+#[cfg(test)]
+mod tests {
+    use std::{
+        collections::HashMap,
+        fs::{self, File},
+        path::Path,
+        sync::{
+            atomic::{AtomicUsize, Ordering},
+            Arc, Mutex,
+        },
+        time::{Duration, Instant},
+    };
+
+    use minijinja::context;
+    use sqlx::SqlitePool;
+    use tempfile::TempDir;
+    use tokio::{
+        io::{AsyncReadExt, AsyncWriteExt},
+        net::TcpListener,
+    };
+
+    use crate::{
+        store::{
+            code::{CodeStore, URL_PREFETCH_CONCURRENCY},
+            db::{DbStore, PAGE_CACHE_TTL},
+            file::{FileStore, MISSING_PAGE_TTL},
+            traits::Store,
+        },
+        Element, Page, StoreConfig,
+    };
+
+    /// File store named "test" with the pages at `path`
+    fn file_store(path: &Path) -> FileStore {
+        FileStore::new(&StoreConfig {
+            name: "test".to_string(),
+            store_type: "file".to_string(),
+            url: "".to_string(),
+            path: path.to_string_lossy().to_string(),
+            tags: vec!["pages".to_string()],
+        })
+        .unwrap()
+    }
+
+    /// Database store named "db", on a new database in `dir`, and its url
+    async fn db_store(dir: &Path) -> (DbStore, String) {
+        let url = format!("sqlite://{}", dir.join("pages.db").display());
+        (DbStore::new("db", &url).await.unwrap(), url)
+    }
+
+    /// Requests seen by `http_server`: how many per path, and the most answered at once
+    #[derive(Default)]
+    struct Hits {
+        paths: Mutex<HashMap<String, usize>>,
+        in_flight: AtomicUsize,
+        max_in_flight: AtomicUsize,
+    }
+
+    /// HTTP server on a local port that answers `{}` after a while, or, for paths
+    /// under /fail/, closes the connection without answering. Returns its URL.
+    async fn http_server() -> (String, Arc<Hits>) {
+        let listener = TcpListener::bind("127.0.0.1:0").await.unwrap();
+        let url = format!("http://{}", listener.local_addr().unwrap());
+        let hits = Arc::new(Hits::default());
+        let server_hits = hits.clone();
+        tokio::spawn(async move {
+            while let Ok((mut socket, _)) = listener.accept().await {
+                let hits = server_hits.clone();
+                tokio::spawn(async move {
+                    let mut request = Vec::new();
+                    let mut buffer = [0u8; 1024];
+                    while !request.windows(4).any(|end| end == b"\r\n\r\n") {
+                        match socket.read(&mut buffer).await {
+                            Ok(0) | Err(_) => return,
+                            Ok(read) => request.extend_from_slice(&buffer[..read]),
+                        }
+                    }
+                    let request = String::from_utf8_lossy(&request);
+                    let path = request.split(' ').nth(1).unwrap_or_default().to_string();
+                    *hits.paths.lock().unwrap().entry(path.clone()).or_default() += 1;
+                    if path.starts_with("/fail/") {
+                        return;
+                    }
+                    let in_flight = hits.in_flight.fetch_add(1, Ordering::SeqCst) + 1;
+                    hits.max_in_flight.fetch_max(in_flight, Ordering::SeqCst);
+                    tokio::time::sleep(Duration::from_millis(50)).await;
+                    hits.in_flight.fetch_sub(1, Ordering::SeqCst);
+                    let _ = socket
+                        .write_all(
+                            b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\nConnection: close\r\n\r\n{}",
+                        )
+                        .await;
+                });
+            }
+        });
+        (url, hits)
+    }
+
+    fn url_context(url: String) -> Element {
+        let data = HashMap::from([
+            ("key".to_string(), "data".to_string()),
+            ("url".to_string(), url),
+        ]);
+        Element::new("code/url_context".to_string(), data, "".to_string())
+    }
+
+    async fn page_title(store: &impl Store, path: &str) -> Option<String> {
+        store
+            .load_page_definition(path)
+            .await
+            .unwrap()
+            .map(|page| page.title)
+    }
+
+    #[tokio::test]
+    async fn test_file_missing_page_ttl() {
+        let dir = TempDir::new().unwrap();
+        let store = file_store(dir.path());
+
+        assert_eq!(page_title(&store, "late").await, None);
+        // written behind the store's back, it is still known to be missing for a while
+        fs::write(dir.path().join("late.yaml"), "title: Late\n").unwrap();
+        assert_eq!(page_title(&store, "late").await, None);
+
+        tokio::time::sleep(MISSING_PAGE_TTL + Duration::from_millis(100)).await;
+        assert_eq!(page_title(&store, "late").await, Some("Late".to_string()));
+    }
+
+    #[tokio::test]
+    async fn test_file_save_forgets_missing_page() {
+        let dir = TempDir::new().unwrap();
+        let store = file_store(dir.path());
+
+        assert_eq!(page_title(&store, "new").await, None);
+        store
+            .save_page_definition("new", &Page::new().with_title("New".to_string()))
+            .await
+            .unwrap();
+        // saved through the store, so found at once
+        assert_eq!(page_title(&store, "new").await, Some("New".to_string()));
+    }
+
+    #[tokio::test]
+    async fn test_file_page_cache_by_mtime_and_size() {
+        let dir = TempDir::new().unwrap();
+        let store = file_store(dir.path());
+        let file_path = dir.path().join("page.yaml");
+
+        fs::write(&file_path, "title: One\n").unwrap();
+        assert_eq!(page_title(&store, "page").await, Some("One".to_string()));
+        let modified = fs::metadata(&file_path).unwrap().modified().unwrap();
+
+        // same size and mtime, so the parsed page is used, without reading the file
+        fs::write(&file_path, "title: Two\n").unwrap();
+        File::options()
+            .write(true)
+            .open(&file_path)
+            .unwrap()
+            .set_modified(modified)
+            .unwrap();
+        assert_eq!(page_title(&store, "page").await, Some("One".to_string()));
+
+        // same mtime, as on coarse filesystems, but another size
+        fs::write(&file_path, "title: Three\n").unwrap();
+        File::options()
+            .write(true)
+            .open(&file_path)
+            .unwrap()
+            .set_modified(modified)
+            .unwrap();
+        assert_eq!(page_title(&store, "page").await, Some("Three".to_string()));
+
+        // same size, but a later mtime
+        fs::write(&file_path, "title: Four!\n").unwrap();
+        File::options()
+            .write(true)
+            .open(&file_path)
+            .unwrap()
+            .set_modified(modified + Duration::from_secs(10))
+            .unwrap();
+        assert_eq!(page_title(&store, "page").await, Some("Four!".to_string()));
+    }
+
+    #[tokio::test]
+    async fn test_file_page_list_counts_page_files() {
+        let dir = TempDir::new().unwrap();
+        fs::write(dir.path().join("a.yaml"), "title: A\n").unwrap();
+        fs::write(dir.path().join("b.yaml"), "title: [not closed\n").unwrap();
+        fs::write(dir.path().join("c.yaml"), "title: C\n").unwrap();
+        fs::write(dir.path().join("notes.txt"), "not a page\n").unwrap();
+        let store = file_store(dir.path());
+
+        // every page file is counted, but only the pages that parse are listed
+        let list = store.get_page_list(0, 10, &HashMap::new()).await.unwrap();
+        assert_eq!(list.count, 3);
+        let ids: Vec<&str> = list.results.iter().map(|page| page.id.as_str()).collect();
+        assert_eq!(ids, ["a", "c"]);
+
+        // so the window of the broken page is empty, and the next one is still c
+        let list = store.get_page_list(1, 1, &HashMap::new()).await.unwrap();
+        assert_eq!(list.count, 3);
+        assert!(list.results.is_empty());
+        let list = store.get_page_list(2, 1, &HashMap::new()).await.unwrap();
+        assert_eq!(list.results[0].id, "c");
+    }
+
+    #[tokio::test]
+    async fn test_file_page_list_keeps_order_past_read_concurrency() {
+        let dir = TempDir::new().unwrap();
+        for i in 0..50 {
+            fs::write(
+                dir.path().join(format!("page{:02}.yaml", i)),
+                format!("title: Page {}\n", i),
+            )
+            .unwrap();
+        }
+        let store = file_store(dir.path());
+
+        // pages are read a few at a time, but listed in page id order
+        let list = store.get_page_list(5, 40, &HashMap::new()).await.unwrap();
+        assert_eq!(list.count, 50);
+        let titles: Vec<&str> = list
+            .results
+            .iter()
+            .map(|page| page.title.as_str())
+            .collect();
+        let expected: Vec<String> = (5..45).map(|i| format!("Page {}", i)).collect();
+        assert_eq!(titles, expected);
+    }
+
+    #[tokio::test]
+    async fn test_db_page_cache_ttl() {
+        let dir = TempDir::new().unwrap();
+        let (store, url) = db_store(dir.path()).await;
+        store
+            .save_page_definition("page", &Page::new().with_title("One".to_string()))
+            .await
+            .unwrap();
+        assert_eq!(page_title(&store, "page").await, Some("One".to_string()));
+
+        // changed by someone else, the cached page is used until it expires
+        let other = SqlitePool::connect(&url).await.unwrap();
+        sqlx::query("UPDATE pages SET data = ? WHERE path = ?")
+            .bind(serde_json::to_string(&Page::new().with_title("Two".to_string())).unwrap())
+            .bind("page")
+            .execute(&other)
+            .await
+            .unwrap();
+        assert_eq!(page_title(&store, "page").await, Some("One".to_string()));
+
+        {
+            let mut pages = store.pages.lock().unwrap();
+            let (_, page) = pages.remove("page").unwrap();
+            let read = Instant::now() - PAGE_CACHE_TTL - Duration::from_secs(1);
+            pages.insert("page".to_string(), (read, page));
+        }
+        assert_eq!(page_title(&store, "page").await, Some("Two".to_string()));
+        assert_eq!(store.pages.lock().unwrap().len(), 1);
+    }
+
+    #[tokio::test]
+    async fn test_db_save_forgets_cached_page() {
+        let dir = TempDir::new().unwrap();
+        let (store, _) = db_store(dir.path()).await;
+        store
+            .save_page_definition("page", &Page::new().with_title("One".to_string()))
+            .await
+            .unwrap();
+        assert_eq!(page_title(&store, "page").await, Some("One".to_string()));
+
+        store
+            .save_page_definition("page", &Page::new().with_title("Two".to_string()))
+            .await
+            .unwrap();
+        assert_eq!(page_title(&store, "page").await, Some("Two".to_string()));
+    }
+
+    #[tokio::test]
+    async fn test_db_page_list_count() {
+        let dir = TempDir::new().unwrap();
+        let (store, _) = db_store(dir.path()).await;
+
+        let list = store.get_page_list(0, 10, &HashMap::new()).await.unwrap();
+        assert_eq!(list.count, 0);
+        assert!(list.results.is_empty());
+
+        for path in ["a", "b", "c"] {
+            store
+                .save_page_definition(path, &Page::new().with_title(path.to_uppercase()))
+                .await
+                .unwrap();
+        }
+
+        // the total comes with the rows of the window
+        let list = store.get_page_list(1, 1, &HashMap::new()).await.unwrap();
+        assert_eq!(list.count, 3);
+        assert_eq!(list.results.len(), 1);
+
+        // no rows to bring it, so it is counted apart: past the end, and an empty window
+        let list = store.get_page_list(10, 5, &HashMap::new()).await.unwrap();
+        assert_eq!(list.count, 3);
+        assert!(list.results.is_empty());
+        let list = store.get_page_list(0, 0, &HashMap::new()).await.unwrap();
+        assert_eq!(list.count, 3);
+        assert!(list.results.is_empty());
+    }
+
+    #[tokio::test]
+    async fn test_code_prefetch_within_concurrency() {
+        let (url, hits) = http_server().await;
+        let elements: Vec<Element> = (0..40)
+            .map(|i| url_context(format!("{}/ok/{}", url, i)))
+            .collect();
+
+        let failed_urls = CodeStore::prefetch_url_contexts(&elements).await;
+        assert!(failed_urls.is_empty());
+        assert_eq!(hits.paths.lock().unwrap().len(), 40);
+        // fetched side by side, but never more than the bound at once
+        let max_in_flight = hits.max_in_flight.load(Ordering::SeqCst);
+        assert!(max_in_flight > 1, "max_in_flight={}", max_in_flight);
+        assert!(
+            max_in_flight <= URL_PREFETCH_CONCURRENCY,
+            "max_in_flight={}",
+            max_in_flight
+        );
+    }
+
+    #[tokio::test]
+    async fn test_code_prefetch_failed_url_not_fetched_again() {
+        let (url, hits) = http_server().await;
+        let failing_url = format!("{}/fail/a", url);
+        let elements = vec![
+            url_context(failing_url.clone()),
+            url_context(format!("{}/ok/a", url)),
+        ];
+
+        let failed_urls = CodeStore::prefetch_url_contexts(&elements).await;
+        assert_eq!(failed_urls.len(), 1);
+        assert!(failed_urls.contains_key(&failing_url));
+
+        // rendering gets the error as is, and the other one from the cache
+        let ctx = context! {};
+        let failed = CodeStore::get_nested_widget_context(&elements[0], &ctx, &failed_urls).await;
+        assert!(failed.is_err());
+        let fetched = CodeStore::get_nested_widget_context(&elements[1], &ctx, &failed_urls).await;
+        assert!(fetched.is_ok());
+
+        let paths = hits.paths.lock().unwrap();
+        assert_eq!(paths.get("/fail/a"), Some(&1));
+        assert_eq!(paths.get("/ok/a"), Some(&1));
+    }
+}